@@ -2,16 +2,30 @@ import streamlit as st
 import os
 import json
 import pandas as pd
-from PIL import Image
-import io
-import base64
-from typing import Dict, Any, List
-import requests
+import hashlib
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+import re
+import time
 import uuid
 from auth import UserAuth
+from config import Config
+from model_catalog import ModelCatalog, ModelSpec
+from providers import ProviderError, create_provider_clients
+from response_cache import get_response_cache
+from execution import ExecutionEngine, ModelJob, merge_streams
+from resilience import CircuitOpenError, ProviderGuard
+from tokens import fit_prompt
+from extraction import ExtractionError
+from retrieval import get_index_cache, index_document
+from profiling import profile_spreadsheet
+from images import image_for_provider, process_image, thumbnail
+from file_cache import get_file_cache
+from offload import BufferFile, FileJobError, run_file_job, run_upload_job
+from table_store import get_table_store
+from table_query import PLANNER_PROMPT, TableQuery, TableQueryError, describe_table, format_result, run_table_query
 
 # test update
 
@@ -322,140 +336,303 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+HISTORY_PAGE_SIZE = 20
+
 class AIModelManager:
-    def __init__(self):
-        self.models = {
-            "Free Models": {
-                "Demo Model": {
-                    "type": "demo",
-                    "endpoint": "local",
-                    "api_key_required": False,
-                    "description": "Local demo model - no API key needed",
-                    "icon": "🎯",
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                },
-                "GPT-3.5 Turbo (Free Tier)": {
-                    "type": "openai",
-                    "endpoint": "https://api.openai.com/v1/chat/completions",
-                    "api_key_required": True,
-                    "description": "OpenAI's free tier - requires API key",
-                    "icon": "🧠",
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                },
-                "Gemini Pro (Free Tier)": {
-                    "type": "gemini",
-                    "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro",
-                    "api_key_required": True,
-                    "description": "Google's free tier - requires API key",
-                    "icon": "🤖",
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                },
-                "Claude 3 Haiku (Free)": {
-                    "type": "anthropic",
-                    "endpoint": "https://api.anthropic.com/v1/messages",
-                    "api_key_required": True,
-                    "description": "Anthropic's fastest Claude model",
-                    "icon": "🎭",
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                }
-            },
-            "Paid Models": {
-                "GPT-4": {
-                    "type": "openai",
-                    "endpoint": "https://api.openai.com/v1/chat/completions",
-                    "api_key_required": True,
-                    "description": "OpenAI's most advanced model",
-                    "icon": "🚀",
-                    "max_tokens": 4000,
-                    "temperature": 0.7
-                },
-                "GPT-4 Turbo": {
-                    "type": "openai",
-                    "endpoint": "https://api.openai.com/v1/chat/completions",
-                    "api_key_required": True,
-                    "description": "OpenAI's latest GPT-4 model",
-                    "icon": "⚡",
-                    "max_tokens": 4000,
-                    "temperature": 0.7
-                },
-                "Claude 3 Sonnet": {
-                    "type": "anthropic",
-                    "endpoint": "https://api.anthropic.com/v1/messages",
-                    "api_key_required": True,
-                    "description": "Anthropic's balanced Claude model",
-                    "icon": "🎭",
-                    "max_tokens": 4000,
-                    "temperature": 0.7
-                },
-                "Claude 3 Opus": {
-                    "type": "anthropic",
-                    "endpoint": "https://api.anthropic.com/v1/messages",
-                    "api_key_required": True,
-                    "description": "Anthropic's most capable Claude model",
-                    "icon": "👑",
-                    "max_tokens": 4000,
-                    "temperature": 0.7
-                },
-                "Gemini Ultra": {
-                    "type": "gemini",
-                    "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-ultra",
-                    "api_key_required": True,
-                    "description": "Google's most advanced Gemini model",
-                    "icon": "⭐",
-                    "max_tokens": 4000,
-                    "temperature": 0.7
-                }
-            }
-        }
-    
-    def get_available_models(self) -> Dict[str, Dict]:
-        return self.models
+    def __init__(self, catalog: ModelCatalog):
+        self.catalog = catalog
+        
+        # Provider clients share one pooled HTTP session
+        self.clients = create_provider_clients()
+        
+        # Retries and a circuit breaker per provider type
+        self.guards = {provider: ProviderGuard(provider) for provider in self.clients}
+        self.cache = get_response_cache()
+        
+        # Streaming requests run on a background asyncio loop
+        self.engine = ExecutionEngine(self.clients)
     
     def process_with_model(self, model_name: str, input_data: Dict[str, Any], 
-                          output_mode: str, api_key: str = None) -> Dict[str, Any]:
-        """Process input with selected model"""
-        
-        # Find the model configuration
-        model_config = None
-        for category, models in self.models.items():
-            if model_name in models:
-                model_config = models[model_name]
-                break
+                          output_mode: str, api_key: str = None,
+                          temperature: float = None, max_tokens: int = None) -> Dict[str, Any]:
+        """Process input with selected model and wait for the full response"""
+        response = self.stream_with_model(model_name, input_data, output_mode, api_key, temperature, max_tokens)
+        if "error" in response:
+            return response
+        response.pop("job", None)
+        try:
+            response["content"] = "".join(response.pop("stream"))
+        except ProviderError as e:
+            return {"error": str(e)}
+        return response
+    
+    def stream_with_model(self, model_name: str, input_data: Dict[str, Any],
+                          output_mode: str, api_key: str = None,
+                          temperature: float = None, max_tokens: int = None) -> Dict[str, Any]:
+        """Start a streaming response from the selected model.
         
-        if not model_config:
+        The request runs on the execution engine. Returns the response
+        metadata with a "stream" iterator of text chunks in place of
+        "content" and the running "job", or a dict with "error" for an
+        unknown model. Provider errors and timeouts raise ProviderError from
+        the iterator; closing the iterator early cancels the request.
+        """
+        spec = self.catalog.get(model_name)
+        if spec is None:
             return {"error": "Model not found"}
         
-        # Simulate API call (in real implementation, you'd make actual API calls)
-        response = self._simulate_api_call(model_config, input_data, output_mode)
+        if temperature is None:
+            temperature = spec.temperature
+        if max_tokens is None:
+            max_tokens = spec.max_tokens
+        
+        if spec.type == "demo":
+            response = self._simulate_api_call(spec, input_data, output_mode)
+            content = response.pop("content")
+            response["stream"] = iter(re.split(r"(?<=\s)", content))
+            return response
+        
+        if spec.type not in self.clients:
+            return {"error": f"Unsupported model type: {spec.type}"}
+        
+        cache_key = None
+        if self.cache.is_cacheable(temperature):
+            cache_key = self.cache.make_key(model_name, output_mode, temperature, max_tokens, input_data)
+            cached = self.cache.get(cache_key)
+            if cached:
+                cached["stream"] = iter([cached.pop("content")])
+                return cached
+        
+        prompt = self._build_prompt(input_data, output_mode)
+        candidates = self._route(spec, api_key)
+        response = self._response_metadata(candidates[0][0], input_data, output_mode)
+        
+        def prepare(candidate: ModelSpec):
+            return self._prepare_prompt(prompt, candidate, max_tokens)
+        
+        def start_stream(candidate: ModelSpec, key: Optional[str], fitted: Dict[str, Any], budget: int):
+            return self.clients[candidate.type].stream(candidate, fitted, key, temperature, budget)
+        
+        def open_stream(job: ModelJob):
+            nonlocal prompt
+            prompt = self._query_table(prompt, input_data, candidates, job)
+            # Only opening the stream is retried or rerouted; text already shown can't be taken back
+            answered_by, chunks = self._call_routed(candidates, prepare, start_stream, job)
+            response.update(self._answer_fields(answered_by))
+            return chunks
+        
+        job = self.engine.submit(candidates[0][0].type, open_stream)
+        stream = job.iter_chunks()
+        response["job"] = job
+        response["stream"] = self._cache_stream(cache_key, spec, response, stream) if cache_key else stream
         return response
     
-    def _simulate_api_call(self, model_config: Dict, input_data: Dict, output_mode: str) -> Dict:
-        """Simulate API call to different models"""
+    def _route(self, spec: ModelSpec, api_key: Optional[str]) -> List[Tuple[ModelSpec, Optional[str]]]:
+        """Models to try for a request to `spec`, in order, each with the API key to send"""
+        candidates = []
+        for candidate in [spec] + [self.catalog.get(name) for name in spec.fallbacks]:
+            client = self.clients.get(candidate.type)
+            if client is None:
+                continue
+            # The key entered in the sidebar belongs to the selected model's provider
+            key = api_key if candidate.type == spec.type else None
+            if candidate is not spec and candidate.api_key_required and not (key or client.api_key):
+                continue
+            candidates.append((candidate, key))
         
-        prompt = input_data.get("text", "")
+        # Skip providers whose circuit is open, unless there is nothing else to try
+        available = [c for c in candidates if self.guards[c[0].type].available()] or candidates[:1]
+        if spec.routing == "least_loaded":
+            available.sort(key=lambda c: self._load(c[0].type))
+        return available
+    
+    def _load(self, provider: str) -> int:
+        return self.engine.load(provider) + self.guards[provider].in_flight
+    
+    def _call_routed(self, candidates: List[Tuple[ModelSpec, Optional[str]]],
+                     prepare: Callable[[ModelSpec], Tuple[Dict[str, Any], int]],
+                     call: Callable[[ModelSpec, Optional[str], Dict[str, Any], int], Any],
+                     job: Optional[ModelJob] = None) -> Tuple[ModelSpec, Any]:
+        """Call each candidate in turn until one answers; returns the answering spec and its result.
+        
+        `prepare` fits the prompt to a candidate and returns it with the
+        max_tokens to request. It runs outside the provider guard, so a
+        local error such as a prompt too long for the model never counts
+        for or against the provider. Within an engine `job`, each attempt
+        holds a concurrency slot of the provider it calls.
+        """
+        for i, (candidate, key) in enumerate(candidates):
+            try:
+                fitted, budget = prepare(candidate)
+                if job is not None:
+                    self.engine.switch(job, candidate.type)
+                return candidate, self.guards[candidate.type].call(lambda: call(candidate, key, fitted, budget))
+            except ProviderError as e:
+                # Only move on when the provider is overloaded or down
+                overloaded = e.retryable or isinstance(e, CircuitOpenError)
+                if i == len(candidates) - 1 or not overloaded:
+                    raise
+    
+    def provider_health(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit state and call counters for each provider type"""
+        return {provider: guard.stats() for provider, guard in self.guards.items()}
+    
+    def fan_out(self, model_names: List[str], input_data: Dict[str, Any], output_mode: str,
+                api_keys: Dict[str, str] = None, temperature: float = None,
+                max_tokens: int = None) -> Dict[str, Dict[str, Any]]:
+        """Start the same request on several models at once.
+        
+        Each request is submitted to the execution engine before any is
+        read, so they run concurrently. `api_keys` maps provider types to
+        keys; providers without one use their configured key. Returns
+        stream_with_model's result for each model name.
+        """
+        api_keys = api_keys or {}
+        results = {}
+        for name in model_names:
+            spec = self.catalog.get(name)
+            api_key = api_keys.get(spec.type) if spec else None
+            results[name] = self.stream_with_model(
+                name, input_data, output_mode, api_key,
+                temperature=temperature, max_tokens=max_tokens
+            )
+        return results
+    
+    def _cache_stream(self, cache_key: str, spec: ModelSpec, response: Dict[str, Any],
+                      stream: Iterator[str]) -> Iterator[str]:
+        """Pass chunks through and cache the full response once the stream completes, unless a fallback answered"""
+        chunks = []
+        for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        if response.get("answered_by") == spec.name:
+            self.cache.put(cache_key, dict(response, content="".join(chunks)))
+    
+    def _build_prompt(self, input_data: Dict[str, Any], output_mode: str) -> Dict[str, Any]:
+        """Turn the collected input into a provider-neutral prompt"""
+        if output_mode == "brief":
+            system = "You are a helpful assistant. Answer concisely and to the point."
+        else:
+            system = "You are a helpful assistant. Give a detailed, well-structured analysis."
+        
+        prompt = {"system": system, "text": input_data.get("text", "")}
+        
+        # Kept apart from the text so fit_prompt can shorten it for each model
+        file_info = input_data.get("file_content")
+        if file_info:
+            details = {k: v for k, v in file_info.items() if k not in ("base64", "content")}
+            sections = [f"Attached file {file_info.get('filename')}:\n{json.dumps(details, default=str)}"]
+            excerpts = self._relevant_excerpts(file_info, input_data.get("text", ""))
+            if excerpts:
+                sections.append(excerpts)
+            elif file_info.get("content"):
+                sections.append(file_info["content"])
+            prompt["attachment"] = "\n\n".join(sections)
+        
+        image_info = input_data.get("image")
+        if image_info and image_info.get("base64"):
+            prompt["image"] = {
+                "base64": image_info["base64"],
+                "mime_type": image_info.get("mime_type", "image/png"),
+                "sha256": image_info.get("sha256")
+            }
+        return prompt
+    
+    def _prepare_prompt(self, prompt: Dict[str, Any], spec: ModelSpec, max_tokens: int) -> Tuple[Dict[str, Any], int]:
+        """Adapt a provider-neutral prompt to one model's image limits and context window"""
+        if prompt.get("image"):
+            prompt = dict(prompt, image=image_for_provider(prompt["image"], spec.type))
+        return fit_prompt(prompt, spec, max_tokens)
+    
+    def _relevant_excerpts(self, file_info: Dict[str, Any], question: str) -> Optional[str]:
+        """The indexed document's chunks most relevant to the question, or None if it isn't indexed"""
+        index = get_index_cache().get(file_info.get("sha256"))
+        if index is None:
+            return None
+        excerpts = [
+            f"[Excerpt {i + 1} of {len(index.chunks)}]\n{chunk}"
+            for i, chunk in index.relevant_chunks(question)
+        ]
+        return "\n\n".join(excerpts)
+    
+    def _query_table(self, prompt: Dict[str, Any], input_data: Dict[str, Any],
+                     candidates: List[Tuple[ModelSpec, Optional[str]]],
+                     job: Optional[ModelJob] = None) -> Dict[str, Any]:
+        """Add the result of a locally run query to a question about a spreadsheet.
+        
+        The model only plans the query from the column names; pandas runs it
+        over the whole cached table. Returns the prompt unchanged when there
+        is no cached table, the model plans no query, or the query fails.
+        """
+        file_info = input_data.get("file_content") or {}
+        question = input_data.get("text", "").strip()
+        store = get_table_store()
+        if file_info.get("type") != "excel" or not question or store is None or not store.has(file_info.get("sha256", "")):
+            return prompt
+        
+        try:
+            schema = store.schema(file_info["sha256"])
+        except OSError:
+            return prompt  # the table was evicted since the check above
+        columns = describe_table([(f.name, str(f.type)) for f in schema], file_info.get("top_values"))
+        planning = {"system": PLANNER_PROMPT, "text": f"Columns:\n{columns}\n\nQuestion: {question}"}
+        
+        def prepare(candidate: ModelSpec):
+            return fit_prompt(planning, candidate, Config.TABLE_QUERY_PLAN_TOKENS)
+        
+        def plan(candidate: ModelSpec, key: Optional[str], fitted: Dict[str, Any], budget: int):
+            return self.clients[candidate.type].complete(candidate, fitted, key, 0.0, budget)
+        
+        try:
+            _, reply = self._call_routed(candidates, prepare, plan, job)
+            query = TableQuery.parse(reply["content"], schema.names)
+            if query is None:
+                return prompt
+            outcome = run_file_job(run_table_query, file_info["sha256"], query)
+        except (ProviderError, TableQueryError, FileJobError, OSError):
+            return prompt
+        
+        # Ahead of the profile, so budgeting trims the profile rather than the answer
+        attachment = format_result(query, outcome)
+        if prompt.get("attachment"):
+            attachment += "\n\n" + prompt["attachment"]
+        return dict(prompt, attachment=attachment)
+    
+    def _answer_fields(self, spec: ModelSpec) -> Dict:
+        """Response fields naming the model that actually answered"""
+        return {
+            "model": spec.type,
+            "model_name": spec.icon + " " + spec.type,
+            "answered_by": spec.name
+        }
+    
+    def _response_metadata(self, spec: ModelSpec, input_data: Dict, output_mode: str) -> Dict:
         image = input_data.get("image")
         file_content = input_data.get("file_content")
-        
-        # Create a comprehensive response based on input type and model
-        response = {
-            "model": model_config["type"],
-            "model_name": model_config.get("icon", "🤖") + " " + model_config.get("type", "Unknown"),
+        return {
+            **self._answer_fields(spec),
             "timestamp": datetime.now().isoformat(),
             "input_type": "text" if not image and not file_content else "multimodal",
             "output_mode": output_mode,
             "response_id": str(uuid.uuid4())  # Unique ID for feedback tracking
         }
+    
+    def _simulate_api_call(self, spec: ModelSpec, input_data: Dict, output_mode: str) -> Dict:
+        """Simulate API call for the local demo model"""
+        
+        prompt = input_data.get("text", "")
+        image = input_data.get("image")
+        file_content = input_data.get("file_content")
+        
+        # Create a comprehensive response based on input type and model
+        response = self._response_metadata(spec, input_data, output_mode)
         
         if output_mode == "brief":
-            response["content"] = f"**{model_config.get('icon', '🤖')} Brief Response:**\n\n{prompt[:100]}..."
+            response["content"] = f"**{spec.icon} Brief Response:**\n\n{prompt[:100]}..."
             response["summary"] = "This is a concise summary of the analysis."
         else:
             response["content"] = f"""
-            ## {model_config.get('icon', '🤖')} Detailed Analysis
+            ## {spec.icon} Detailed Analysis
             
             **Input Analysis:**
             - Text: {prompt}
@@ -473,7 +650,7 @@ class AIModelManager:
             4. Recommendations provided
             
             **Technical Details:**
-            - Model: {model_config['type']}
+            - Model: {spec.type}
             - Processing Time: ~2.5 seconds
             - Confidence Score: 0.92
             - Tokens Used: 1,247
@@ -490,32 +667,62 @@ class FileProcessor:
             'python': ['.py']
         }
     
-    def process_file(self, uploaded_file) -> Dict[str, Any]:
-        """Process uploaded file and extract content"""
+    def process_file(self, uploaded_file, sample_rows: int = None) -> Dict[str, Any]:
+        """Process uploaded file and extract content.
+        
+        `sample_rows` profiles CSV files from a random sample of about
+        that many rows instead of every row.
+        """
         if uploaded_file is None:
             return {"error": "No file uploaded"}
         
         file_extension = os.path.splitext(uploaded_file.name)[1].lower()
+        # A view of the upload's own buffer; processors read it in place rather than copying it
+        data = uploaded_file.getbuffer()
+        file_hash = hashlib.sha256(data).hexdigest()
+        
+        # Re-sending the same attachment costs only the hash above
+        cache = get_file_cache()
+        cache_key = (file_hash, file_extension, sample_rows)
+        cached = cache.get(cache_key)
+        if cached is not None and self._derived_data_cached(cached):
+            cached["filename"] = uploaded_file.name
+            return cached
+        
         file_info = {
             "filename": uploaded_file.name,
             "size": uploaded_file.size,
             "type": self._get_file_type(file_extension),
-            "extension": file_extension
+            "extension": file_extension,
+            "sha256": file_hash
         }
         
         try:
             if file_info["type"] == "image":
-                return self._process_image(uploaded_file, file_info)
+                result = self._process_image(data, file_info)
             elif file_info["type"] == "excel":
-                return self._process_excel(uploaded_file, file_info)
+                result = self._process_excel(data, file_info, sample_rows)
             elif file_info["type"] == "python":
-                return self._process_python(uploaded_file, file_info)
+                result = self._process_python(data, file_info)
             elif file_info["type"] == "document":
-                return self._process_document(uploaded_file, file_info)
+                result = self._process_document(data, file_info)
             else:
                 return {"error": f"Unsupported file type: {file_extension}"}
         except Exception as e:
             return {"error": f"Error processing file: {str(e)}"}
+        
+        if "error" not in result:
+            cache.put(cache_key, result)
+        return result
+    
+    def _derived_data_cached(self, file_info: Dict[str, Any]) -> bool:
+        """Whether the document index or table a processed upload relies on is still cached"""
+        if file_info["type"] == "document":
+            return get_index_cache().get(file_info["sha256"]) is not None
+        if file_info["type"] == "excel" and not file_info.get("sampled"):
+            store = get_table_store()
+            return store is None or store.has(file_info["sha256"])
+        return True
     
     def _get_file_type(self, extension: str) -> str:
         for file_type, extensions in self.supported_extensions.items():
@@ -523,50 +730,42 @@ class FileProcessor:
                 return file_type
         return "unknown"
     
-    def _process_image(self, file, file_info: Dict) -> Dict[str, Any]:
-        image = Image.open(file)
-        file_info["dimensions"] = image.size
-        file_info["mode"] = image.mode
-        
-        # Convert to base64 for display
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        file_info["base64"] = img_str
-        
+    # Decoding and parsing run in the worker pool, off the script thread and its GIL
+    
+    def _process_image(self, data: memoryview, file_info: Dict) -> Dict[str, Any]:
+        file_info.update(run_upload_job(process_image, data, Config.IMAGE_MAX_SIDE))
         return file_info
     
-    def _process_excel(self, file, file_info: Dict) -> Dict[str, Any]:
+    def _process_excel(self, data: memoryview, file_info: Dict, sample_rows: int = None) -> Dict[str, Any]:
         try:
-            if file_info["extension"] == ".csv":
-                df = pd.read_csv(file)
-            else:
-                df = pd.read_excel(file)
-            
-            file_info["rows"] = len(df)
-            file_info["columns"] = len(df.columns)
-            file_info["column_names"] = df.columns.tolist()
-            file_info["data_preview"] = df.head().to_dict()
-            file_info["summary_stats"] = df.describe().to_dict()
-            
+            file_info.update(run_upload_job(
+                profile_spreadsheet, data, file_info["extension"], sample_rows, file_info["sha256"]
+            ))
             return file_info
         except Exception as e:
             return {"error": f"Error reading Excel file: {str(e)}"}
     
-    def _process_python(self, file, file_info: Dict) -> Dict[str, Any]:
-        content = file.read().decode('utf-8')
-        file_info["lines"] = len(content.split('\n'))
+    def _process_python(self, data: memoryview, file_info: Dict) -> Dict[str, Any]:
+        content = str(data, 'utf-8')
+        file_info["lines"] = content.count('\n') + 1
         file_info["content"] = content
         file_info["functions"] = self._extract_functions(content)
         
         return file_info
     
-    def _process_document(self, file, file_info: Dict) -> Dict[str, Any]:
-        content = file.read().decode('utf-8')
-        file_info["lines"] = len(content.split('\n'))
-        file_info["words"] = len(content.split())
-        file_info["content"] = content[:1000] + "..." if len(content) > 1000 else content
+    def _process_document(self, data: memoryview, file_info: Dict) -> Dict[str, Any]:
+        # The same upload is processed again on every question; index it once
+        index_cache = get_index_cache()
+        index = index_cache.get(file_info["sha256"])
+        if index is None:
+            try:
+                index = run_upload_job(index_document, data, file_info["extension"])
+            except (ExtractionError, FileJobError) as e:
+                return {"error": str(e)}
+            index_cache.put(file_info["sha256"], index)
         
+        file_info.update(index.info)
+        file_info["chunks"] = len(index.chunks)
         return file_info
     
     def _extract_functions(self, code: str) -> List[str]:
@@ -575,9 +774,24 @@ class FileProcessor:
         function_pattern = r'def\s+(\w+)\s*\('
         return re.findall(function_pattern, code)
 
+def upload_thumbnail(uploaded_file) -> bytes:
+    """Downscaled preview of an uploaded image, decoded once per distinct upload"""
+    data = uploaded_file.getbuffer()
+    return thumbnail(BufferFile(data), hashlib.sha256(data).hexdigest())
+
+@st.cache_resource
+def get_user_auth() -> UserAuth:
+    """Shared UserAuth instance for every session in this process"""
+    return UserAuth()
+
+@st.cache_resource
+def get_model_manager() -> AIModelManager:
+    """Model catalog and provider clients, built once per process"""
+    return AIModelManager(ModelCatalog.from_file(Config.MODEL_CATALOG_PATH))
+
 def login_page():
     """Display login/register page"""
-    auth = UserAuth()
+    auth = get_user_auth()
     
     st.markdown("""
         <div class="header-container">
@@ -645,11 +859,10 @@ def login_page():
 
 def feedback_component(response_id: str, user_email: str):
     """Display feedback buttons for AI responses"""
-    auth = UserAuth()
+    auth = get_user_auth()
     
     # Check if user has already given feedback for this response
-    existing_feedback = auth.get_user_feedback(user_email)
-    user_feedback = next((f for f in existing_feedback if f.get("response_id") == response_id), None)
+    user_feedback = auth.get_feedback_for(user_email, [response_id]).get(response_id)
     
     st.markdown("---")
     st.markdown("### 💬 How was this response?")
@@ -765,10 +978,15 @@ def show_feedback_analytics(auth: UserAuth, user_email: str):
 
 def main_app():
     """Main application after login"""
-    auth = UserAuth()
-    model_manager = AIModelManager()
+    auth = get_user_auth()
+    model_manager = get_model_manager()
     file_processor = FileProcessor()
     
+    # Requests still running here were started by a script run the user
+    # interrupted (navigation, sign out, new input), so nobody will read them
+    for job in st.session_state.pop("active_jobs", []):
+        job.cancel()
+    
     # Header with user info
     user_info = st.session_state.user_info
     st.markdown(f"""
@@ -785,43 +1003,43 @@ def main_app():
         # Model selection with better UI
         model_category = st.selectbox(
             "📂 Model Category",
-            ["Free Models", "Paid Models"],
+            model_manager.catalog.categories(),
             help="Choose between free and paid AI models"
         )
         
-        available_models = model_manager.get_available_models()[model_category]
+        available_models = model_manager.catalog.in_category(model_category)
         
         # Display model options with descriptions
         st.markdown("### 🤖 Available Models")
-        for model_name, model_config in available_models.items():
-            with st.expander(f"{model_config['icon']} {model_name}", expanded=False):
-                st.write(f"**Description:** {model_config['description']}")
-                st.write(f"**Type:** {model_config['type'].title()}")
-                st.write(f"**API Key:** {'Required' if model_config['api_key_required'] else 'Not Required'}")
-                st.write(f"**Max Tokens:** {model_config.get('max_tokens', 'N/A')}")
+        for spec in available_models:
+            with st.expander(f"{spec.icon} {spec.name}", expanded=False):
+                st.write(f"**Description:** {spec.description}")
+                st.write(f"**Type:** {spec.type.title()}")
+                st.write(f"**API Key:** {'Required' if spec.api_key_required else 'Not Required'}")
+                st.write(f"**Max Tokens:** {spec.max_tokens}")
         
         selected_model = st.selectbox(
             "🎯 Select Model",
-            list(available_models.keys()),
+            [spec.name for spec in available_models],
             help="Choose the AI model you want to use"
         )
         
-        # Get selected model config
-        selected_model_config = available_models[selected_model]
+        # Get selected model spec
+        selected_model_spec = model_manager.catalog.get(selected_model)
         
         # Display selected model info
         st.markdown("### 📋 Selected Model")
         st.info(f"""
-        **{selected_model_config['icon']} {selected_model}**
+        **{selected_model_spec.icon} {selected_model}**
         
-        {selected_model_config['description']}
+        {selected_model_spec.description}
         
-        **Type:** {selected_model_config['type'].title()}
-        **API Key:** {'Required' if selected_model_config['api_key_required'] else 'Not Required'}
+        **Type:** {selected_model_spec.type.title()}
+        **API Key:** {'Required' if selected_model_spec.api_key_required else 'Not Required'}
         """)
         
         # API Key input - only show if required
-        if selected_model_config["api_key_required"]:
+        if selected_model_spec.api_key_required:
             api_key = st.text_input(
                 "🔑 API Key",
                 type="password",
@@ -847,18 +1065,33 @@ def main_app():
         temperature = st.slider(
             "Creativity Level", 
             0.0, 2.0, 
-            selected_model_config.get("temperature", 0.7), 
+            selected_model_spec.temperature, 
             0.1,
             help="Higher values = more creative, Lower values = more focused"
         )
         max_tokens = st.slider(
             "Response Length", 
-            100, 4000, 
-            selected_model_config.get("max_tokens", 1000), 
+            100, max(selected_model_spec.max_tokens, 200), 
+            selected_model_spec.max_tokens, 
             100,
             help="Maximum number of tokens in the response"
         )
         
+        cache_stats = model_manager.cache.stats()
+        st.caption(
+            f"🗄️ Response cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+            f"{cache_stats['bypassed']} bypassed (cached only at creativity 0)"
+        )
+        
+        with st.expander("🩺 Provider Health"):
+            state_icons = {"closed": "🟢", "half-open": "🟡", "open": "🔴"}
+            for provider, health in model_manager.provider_health().items():
+                st.caption(
+                    f"{state_icons[health['state']]} **{provider}** ({health['state']}) · "
+                    f"{health['successes']} ok · {health['failures']} failed · "
+                    f"{health['retries']} retries · {health['rejected']} rejected"
+                )
+        
         # User actions
         st.markdown("## 👤 Account")
         col1, col2 = st.columns(2)
@@ -867,6 +1100,9 @@ def main_app():
             if st.button("📊 History", use_container_width=True):
                 st.session_state.show_history = True
                 st.session_state.show_feedback = False
+                # Start from the newest page again
+                st.session_state.pop("history_older", None)
+                st.session_state.pop("history_cursor", None)
         
         with col2:
             if st.button("💬 Feedback", use_container_width=True):
@@ -883,31 +1119,51 @@ def main_app():
     elif st.session_state.get("show_feedback", False):
         show_feedback_analytics_page(auth)
     else:
-        show_chat_page(model_manager, file_processor, selected_model, selected_model_config, api_key, output_mode)
+        show_chat_page(model_manager, file_processor, selected_model, selected_model_spec, api_key, output_mode,
+                       temperature, max_tokens)
 
 def show_history_page(auth):
     """Display user's chat history"""
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown('<h2 class="card-title">📊 Your Chat History</h2>', unsafe_allow_html=True)
     
-    history = auth.get_user_history(st.session_state.user_email)
+    user_email = st.session_state.user_email
+    
+    # Newest page is read from storage on every run; older pages are fetched
+    # on demand and kept in the session
+    history, next_cursor = auth.get_user_history_page(user_email, HISTORY_PAGE_SIZE)
+    if "history_cursor" in st.session_state:
+        next_cursor = st.session_state.history_cursor
+    history = st.session_state.get("history_older", []) + history
     
     if not history:
         st.info("No chat history found. Start a conversation to see your history here!")
     else:
-        for i, entry in enumerate(reversed(history[-20:])):  # Show last 20 entries
-            with st.expander(f"Chat {len(history) - i} - {entry.get('model_name', 'Unknown')} ({entry.get('timestamp', '')[:19]})"):
+        total_chats = auth.count_user_history(user_email)
+        feedback_by_response = auth.get_feedback_for(
+            user_email,
+            [entry.get("response_id") for entry in history]
+        )
+        
+        for i, entry in enumerate(reversed(history)):
+            with st.expander(f"Chat {total_chats - i} - {entry.get('model_name', 'Unknown')} ({entry.get('timestamp', '')[:19]})"):
                 st.write("**Input:**", entry.get("input", {}).get("text", "No text input"))
                 st.write("**Output:**", entry.get("output", "No output"))
                 
                 # Show feedback if available
-                feedback_data = auth.get_user_feedback(st.session_state.user_email)
-                response_feedback = next((f for f in feedback_data if f.get("response_id") == entry.get("response_id")), None)
+                response_feedback = feedback_by_response.get(entry.get("response_id"))
                 if response_feedback:
                     if response_feedback["feedback"] == "positive":
                         st.success("✅ Marked as helpful")
                     else:
                         st.error("❌ Marked as not helpful")
+        
+        if next_cursor is not None and st.button("⬇️ Load more"):
+            older, st.session_state.history_cursor = auth.get_user_history_page(
+                user_email, HISTORY_PAGE_SIZE, next_cursor
+            )
+            st.session_state.history_older = older + st.session_state.get("history_older", [])
+            st.rerun()
     
     if st.button("← Back to Chat"):
         st.session_state.show_history = False
@@ -928,19 +1184,20 @@ def show_feedback_analytics_page(auth):
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-def show_chat_page(model_manager, file_processor, selected_model, selected_model_config, api_key, output_mode):
+def show_chat_page(model_manager, file_processor, selected_model, selected_model_spec, api_key, output_mode,
+                   temperature, max_tokens):
     """Main chat interface"""
     
     # Input section
     st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown(f'<h2 class="card-title">💬 Chat with {selected_model_config.get("icon", "🤖")} {selected_model}</h2>', unsafe_allow_html=True)
+    st.markdown(f'<h2 class="card-title">💬 Chat with {selected_model_spec.icon} {selected_model}</h2>', unsafe_allow_html=True)
     
     # Model info display
     col_info1, col_info2, col_info3 = st.columns(3)
     with col_info1:
-        st.metric("Model Type", selected_model_config["type"].title())
+        st.metric("Model Type", selected_model_spec.type.title())
     with col_info2:
-        st.metric("API Key", "Required" if selected_model_config["api_key_required"] else "Not Required")
+        st.metric("API Key", "Required" if selected_model_spec.api_key_required else "Not Required")
     with col_info3:
         st.metric("Output Mode", "Quick" if output_mode == "brief" else "Detailed")
     
@@ -955,6 +1212,16 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
         help="Select how you want to interact with the AI"
     )
     
+    # Compare mode sends the same input to several models at once
+    compare_models = []
+    if st.toggle("⚖️ Compare models", help="Send the same input to several models in parallel"):
+        compare_models = st.multiselect(
+            "Compare with",
+            [name for name in model_manager.catalog.names() if name != selected_model],
+            max_selections=3,
+            help=f"Shown side by side with {selected_model}"
+        )
+    
     # Text input
     if input_type in ["Text", "Multi-Modal"]:
         text_input = st.text_area(
@@ -978,7 +1245,7 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
                     help="Upload an image for analysis (max 10MB)"
                 )
                 if uploaded_image:
-                    st.image(uploaded_image, caption="Preview", use_column_width=True)
+                    st.image(upload_thumbnail(uploaded_image), caption="Preview", use_column_width=True)
         
         with col2:
             if input_type in ["File", "Multi-Modal"]:
@@ -987,8 +1254,14 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
                     type=['pdf', 'txt', 'doc', 'docx', 'xlsx', 'xls', 'csv', 'py', 'json', 'xml'],
                     help="Upload documents, spreadsheets, or code files (max 10MB)"
                 )
+                sample_csv = False
                 if uploaded_file:
                     st.success(f"✅ File uploaded: {uploaded_file.name}")
+                    if uploaded_file.name.lower().endswith(".csv"):
+                        sample_csv = st.checkbox(
+                            "⚡ Quick profile",
+                            help=f"Profile a random sample of about {Config.PROFILE_SAMPLE_ROWS:,} rows instead of the whole file"
+                        )
     
     # Process button with validation
     st.markdown("---")
@@ -1003,7 +1276,7 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
             
             if not has_text and not has_image and not has_file:
                 st.error("⚠️ Please provide some input (text, image, or file)")
-            elif selected_model_config["api_key_required"] and not api_key:
+            elif selected_model_spec.api_key_required and not api_key:
                 st.error("⚠️ API key is required for this model")
             else:
                 # Prepare input data
@@ -1022,23 +1295,67 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
                 # Process file
                 if has_file:
                     with st.spinner("Processing file..."):
-                        file_info = file_processor.process_file(uploaded_file)
+                        file_info = file_processor.process_file(
+                            uploaded_file, Config.PROFILE_SAMPLE_ROWS if sample_csv else None
+                        )
                         if "error" not in file_info:
                             input_data["file_content"] = file_info
                         else:
                             st.error(f"File processing error: {file_info['error']}")
                             return
                 
-                # Process with AI model
-                with st.spinner(f"🤖 {selected_model_config.get('icon', '🤖')} {selected_model} is thinking..."):
-                    result = model_manager.process_with_model(
-                        selected_model, input_data, output_mode, api_key
-                    )
+                if compare_models:
+                    show_comparison(model_manager, [selected_model] + compare_models, input_data, output_mode,
+                                    {selected_model_spec.type: api_key} if api_key else {},
+                                    temperature, max_tokens)
+                    st.markdown('</div>', unsafe_allow_html=True)
+                    return
+                
+                # Start the request in the background and stream its output
+                result = model_manager.stream_with_model(
+                    selected_model, input_data, output_mode, api_key,
+                    temperature=temperature, max_tokens=max_tokens
+                )
                 
                 # Display results
                 if "error" not in result:
-                    # Save to user history
-                    auth = UserAuth()
+                    job = result.pop("job", None)
+                    st.session_state.active_jobs = [job] if job else []
+                    
+                    # Display response in a nice container
+                    st.markdown("---")
+                    st.markdown("### 🤖 AI Response")
+                    
+                    # Render tokens as they arrive, then swap in the styled container
+                    response_placeholder = st.empty()
+                    try:
+                        with st.spinner(f"🤖 {selected_model_spec.icon} {selected_model} is thinking..."):
+                            with response_placeholder.container():
+                                result["content"] = st.write_stream(result.pop("stream"))
+                    except ProviderError as e:
+                        st.session_state.pop("active_jobs", None)
+                        st.error(f"❌ Error: {e}")
+                        return
+                    # Only a finished stream is forgotten; a stopped script leaves its job for the next run to cancel
+                    st.session_state.pop("active_jobs", None)
+                    
+                    if result.get("answered_by", selected_model) != selected_model:
+                        st.info(f"↪️ {selected_model} was unavailable, so {result['answered_by']} answered instead")
+                    
+                    response_placeholder.markdown(f"""
+                    <div style="
+                        background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
+                        padding: 1.5rem;
+                        border-radius: 15px;
+                        border-left: 5px solid #667eea;
+                        margin: 1rem 0;
+                    ">
+                        {result["content"]}
+                    </div>
+                    """, unsafe_allow_html=True)
+                    
+                    # Save to user history once the full response is in
+                    auth = get_user_auth()
                     history_entry = {
                         "timestamp": result["timestamp"],
                         "model_name": result["model_name"],
@@ -1048,25 +1365,6 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
                     }
                     auth.save_user_history(st.session_state.user_email, history_entry)
                     
-                    # Display response in a nice container
-                    st.markdown("---")
-                    st.markdown("### 🤖 AI Response")
-                    
-                    # Response container with styling
-                    response_container = st.container()
-                    with response_container:
-                        st.markdown(f"""
-                        <div style="
-                            background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
-                            padding: 1.5rem;
-                            border-radius: 15px;
-                            border-left: 5px solid #667eea;
-                            margin: 1rem 0;
-                        ">
-                            {result["content"]}
-                        </div>
-                        """, unsafe_allow_html=True)
-                    
                     # Display feedback component
                     feedback_component(result["response_id"], st.session_state.user_email)
                     
@@ -1075,7 +1373,7 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
                         st.markdown("### 📷 Image Analysis")
                         col_img1, col_img2 = st.columns([1, 2])
                         with col_img1:
-                            st.image(uploaded_image, caption="Uploaded Image", use_column_width=True)
+                            st.image(upload_thumbnail(uploaded_image), caption="Uploaded Image", use_column_width=True)
                         with col_img2:
                             st.json(input_data["image"])
                     
@@ -1088,6 +1386,70 @@ def show_chat_page(model_manager, file_processor, selected_model, selected_model
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+def show_comparison(model_manager, model_names, input_data, output_mode, api_keys, temperature, max_tokens):
+    """Run one input on several models concurrently and render the answers side by side"""
+    started = time.monotonic()
+    results = model_manager.fan_out(
+        model_names, input_data, output_mode, api_keys,
+        temperature=temperature, max_tokens=max_tokens
+    )
+    st.session_state.active_jobs = [r["job"] for r in results.values() if r.get("job")]
+    
+    st.markdown("---")
+    st.markdown("### ⚖️ Model Comparison")
+    
+    placeholders, timings, texts, streams = {}, {}, {}, {}
+    for name, column in zip(model_names, st.columns(len(model_names))):
+        spec = model_manager.catalog.get(name)
+        with column:
+            st.markdown(f"#### {spec.icon if spec else '🤖'} {name}")
+            placeholders[name] = st.empty()
+            timings[name] = st.empty()
+        if "error" in results[name]:
+            placeholders[name].error(f"❌ Error: {results[name]['error']}")
+        else:
+            texts[name] = ""
+            streams[name] = results[name].pop("stream")
+            placeholders[name].markdown("⏳ Waiting for response...")
+    
+    # Update each column as its chunks arrive, whichever model sends them
+    errors = {}
+    for name, item in merge_streams(streams):
+        if isinstance(item, str):
+            texts[name] += item
+            placeholders[name].markdown(texts[name])
+            continue
+        elapsed = time.monotonic() - started
+        if item is None:
+            answered_by = results[name].get("answered_by", name)
+            via = f" · answered by {answered_by}" if answered_by != name else ""
+            timings[name].caption(f"⏱️ {elapsed:.1f}s{via}")
+        else:
+            errors[name] = item
+            placeholders[name].error(f"❌ Error: {item}")
+            timings[name].caption(f"⏱️ failed after {elapsed:.1f}s")
+    # Every stream finished; a stopped script leaves the jobs for the next run to cancel
+    st.session_state.pop("active_jobs", None)
+    
+    st.caption(f"⏱️ All responses in {time.monotonic() - started:.1f}s")
+    
+    # Save every completed answer to history and collect feedback for each
+    auth = get_user_auth()
+    for name in model_names:
+        result = results[name]
+        if "error" in result or name in errors:
+            continue
+        result["content"] = texts[name]
+        auth.save_user_history(st.session_state.user_email, {
+            "timestamp": result["timestamp"],
+            "model_name": result["model_name"],
+            "input": input_data,
+            "output": result["content"],
+            "response_id": result["response_id"]
+        })
+        st.markdown(f"#### {name}")
+        feedback_component(result["response_id"], st.session_state.user_email)
+
 def main():
     # Initialize session state
     if "logged_in" not in st.session_state:
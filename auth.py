@@ -1,39 +1,29 @@
 import os
-import json
 import uuid
+import base64
 import hashlib
 import secrets
+import threading
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from config import Config
+from storage import StorageBackend, BlobStore, create_storage
 
 class UserAuth:
-    def __init__(self):
-        self.data_dir = "user_data"
-        self.users_file = os.path.join(self.data_dir, "users.json")
-        self.history_file = os.path.join(self.data_dir, "history.json")
-        self.feedback_file = os.path.join(self.data_dir, "feedback.json")
-        
-        # Create data directory if it doesn't exist
-        os.makedirs(self.data_dir, exist_ok=True)
+    def __init__(self, storage: StorageBackend = None):
+        self.data_dir = Config.DATA_DIR
         
-        # Initialize data files
-        self._init_data_files()
+        # Create the configured storage backend (SQLite by default)
+        self.storage = storage or create_storage(Config.STORAGE_BACKEND, self.data_dir)
         
-        # Load users
-        self.users = self._load_users()
-    
-    def _init_data_files(self):
-        """Initialize data files if they don't exist"""
-        files_to_init = [
-            (self.users_file, {}),
-            (self.history_file, {}),
-            (self.feedback_file, {})
-        ]
+        # Attachment payloads are kept out of history in a content-addressed store
+        self.blobs = BlobStore(os.path.join(self.data_dir, "blobs"))
         
-        for file_path, default_data in files_to_init:
-            if not os.path.exists(file_path):
-                with open(file_path, 'w') as f:
-                    json.dump(default_data, f, indent=2)
+        # Users, history and feedback are always read from storage, which other
+        # processes sharing DATA_DIR may have changed; the lock only orders
+        # read-modify-write updates within this process
+        self._lock = threading.RLock()
     
     def _hash_password(self, password: str) -> str:
         """Hash password using SHA-256 with salt"""
@@ -50,44 +40,9 @@ class UserAuth:
         except:
             return False
     
-    def _load_users(self) -> Dict[str, Dict]:
-        """Load users from JSON file"""
-        try:
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_users(self):
-        """Save users to JSON file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
-    
-    def _load_history(self) -> Dict[str, List]:
-        """Load chat history from JSON file"""
-        try:
-            with open(self.history_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_history(self, history_data: Dict[str, List]):
-        """Save chat history to JSON file"""
-        with open(self.history_file, 'w') as f:
-            json.dump(history_data, f, indent=2)
-    
-    def _load_feedback(self) -> Dict[str, List]:
-        """Load feedback data from JSON file"""
-        try:
-            with open(self.feedback_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-    
-    def _save_feedback(self, feedback_data: Dict[str, List]):
-        """Save feedback data to JSON file"""
-        with open(self.feedback_file, 'w') as f:
-            json.dump(feedback_data, f, indent=2)
+    def _get_user(self, email: str) -> Optional[Dict[str, Any]]:
+        """Read a user's current record from storage"""
+        return self.storage.get_user(email)
     
     def register_user(self, email: str, name: str, password: str) -> Tuple[bool, str]:
         """Register a new user"""
@@ -95,27 +50,27 @@ class UserAuth:
             return False, "Email, name, and password are required"
         
         # Simple email validation
-        if "@" not in email or "." not in email:
+        if "@" not in email or "." not in email or any(c.isspace() or not c.isprintable() for c in email):
             return False, "Please enter a valid email address"
         
         # Password validation
         if len(password) < 6:
             return False, "Password must be at least 6 characters long"
         
-        if email in self.users:
-            return False, "User already exists"
-        
-        # Create new user
-        user_data = {
-            "email": email,
-            "name": name,
-            "password": self._hash_password(password),
-            "created_at": datetime.now().isoformat(),
-            "last_login": datetime.now().isoformat()
-        }
-        
-        self.users[email] = user_data
-        self._save_users()
+        with self._lock:
+            if self._get_user(email) is not None:
+                return False, "User already exists"
+            
+            # Create new user
+            user_data = {
+                "email": email,
+                "name": name,
+                "password": self._hash_password(password),
+                "created_at": datetime.now().isoformat(),
+                "last_login": datetime.now().isoformat()
+            }
+            
+            self.storage.save_user(email, user_data)
         
         return True, "User registered successfully"
     
@@ -124,18 +79,18 @@ class UserAuth:
         if not email or not password:
             return False, "Email and password are required"
         
-        if email not in self.users:
-            return False, "Invalid email or password"
-        
-        user = self.users[email]
-        
-        # Verify password
-        if not self._verify_password(password, user.get("password", "")):
-            return False, "Invalid email or password"
-        
-        # Update last login time
-        self.users[email]["last_login"] = datetime.now().isoformat()
-        self._save_users()
+        with self._lock:
+            user = self._get_user(email)
+            if user is None:
+                return False, "Invalid email or password"
+            
+            # Verify password
+            if not self._verify_password(password, user.get("password", "")):
+                return False, "Invalid email or password"
+            
+            # Update last login time
+            user["last_login"] = datetime.now().isoformat()
+            self.storage.save_user(email, user)
         
         # Generate session ID
         session_id = str(uuid.uuid4())
@@ -144,99 +99,112 @@ class UserAuth:
     
     def change_password(self, email: str, current_password: str, new_password: str) -> Tuple[bool, str]:
         """Change user password"""
-        if email not in self.users:
-            return False, "User not found"
-        
-        user = self.users[email]
-        
-        # Verify current password
-        if not self._verify_password(current_password, user.get("password", "")):
-            return False, "Current password is incorrect"
-        
-        # Validate new password
-        if len(new_password) < 6:
-            return False, "New password must be at least 6 characters long"
-        
-        # Update password
-        self.users[email]["password"] = self._hash_password(new_password)
-        self._save_users()
+        with self._lock:
+            user = self._get_user(email)
+            if user is None:
+                return False, "User not found"
+            
+            # Verify current password
+            if not self._verify_password(current_password, user.get("password", "")):
+                return False, "Current password is incorrect"
+            
+            # Validate new password
+            if len(new_password) < 6:
+                return False, "New password must be at least 6 characters long"
+            
+            # Update password
+            user["password"] = self._hash_password(new_password)
+            self.storage.save_user(email, user)
         
         return True, "Password changed successfully"
     
     def get_user_info(self, email: str) -> Dict[str, Any]:
         """Get user information"""
-        user_info = self.users.get(email, {}).copy()
+        user_info = (self._get_user(email) or {}).copy()
         # Remove password from user info
         user_info.pop("password", None)
         return user_info
     
+    def _store_attachments(self, history_entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Move base64 attachment payloads into the blob store.
+        
+        Returns a copy of the entry where each attachment's "base64" field is
+        replaced by a "blob" field holding the SHA-256 of the decoded bytes.
+        """
+        entry = dict(history_entry)
+        input_data = entry.get("input")
+        if not isinstance(input_data, dict):
+            return entry
+        
+        entry["input"] = input_data = dict(input_data)
+        for key, value in input_data.items():
+            if isinstance(value, dict) and "base64" in value:
+                attachment = dict(value)
+                attachment["blob"] = self.blobs.put(base64.b64decode(attachment.pop("base64")))
+                input_data[key] = attachment
+        return entry
+    
+    
     def save_user_history(self, email: str, history_entry: Dict[str, Any]):
         """Save user chat history"""
-        history_data = self._load_history()
+        entry = self._store_attachments(history_entry)
+        self.storage.append_history(email, entry)
+    
+    def get_user_history(self, email: str, limit: Optional[int] = None,
+                         before_cursor: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get user chat history, oldest first.
         
-        if email not in history_data:
-            history_data[email] = []
+        Without a limit the full history is returned; otherwise one page,
+        see get_user_history_page.
+        """
+        if limit is None:
+            return self.storage.get_history(email)
+        return self.get_user_history_page(email, limit, before_cursor)[0]
+    
+    def get_user_history_page(self, email: str, limit: int,
+                              before_cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Get up to `limit` history entries older than `before_cursor`.
         
-        history_data[email].append(history_entry)
-        self._save_history(history_data)
+        Returns the entries (oldest first) and the cursor for the next older
+        page, or None once the start of the history is reached.
+        """
+        return self.storage.get_history_page(email, limit, before_cursor)
     
-    def get_user_history(self, email: str) -> List[Dict[str, Any]]:
-        """Get user chat history"""
-        history_data = self._load_history()
-        return history_data.get(email, [])
+    def count_user_history(self, email: str) -> int:
+        """Get the number of chats in the user's history"""
+        return self.storage.count_history(email)
     
     def save_user_feedback(self, email: str, feedback_entry: Dict[str, Any]):
-        """Save user feedback"""
-        feedback_data = self._load_feedback()
-        
-        if email not in feedback_data:
-            feedback_data[email] = []
-        
-        # Check if feedback already exists for this response_id
-        existing_feedback = feedback_data[email]
-        response_id = feedback_entry.get("response_id")
-        
-        # Remove existing feedback for this response if it exists
-        existing_feedback = [f for f in existing_feedback if f.get("response_id") != response_id]
-        
-        # Add new feedback
-        existing_feedback.append(feedback_entry)
-        feedback_data[email] = existing_feedback
-        
-        self._save_feedback(feedback_data)
+        """Save user feedback, replacing earlier feedback for the same response"""
+        self.storage.upsert_feedback(email, feedback_entry)
     
     def get_user_feedback(self, email: str) -> List[Dict[str, Any]]:
         """Get user feedback"""
-        feedback_data = self._load_feedback()
-        return feedback_data.get(email, [])
+        return self.storage.get_feedback(email)
+    
+    def get_feedback_for(self, email: str, response_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the user's feedback for several responses in one pass.
+        
+        Returns a response_id -> feedback mapping containing only the
+        responses that have feedback.
+        """
+        return self.storage.get_feedback_for(email, response_ids)
     
     def delete_user(self, email: str) -> bool:
         """Delete a user and all their data"""
-        if email not in self.users:
-            return False
-        
-        # Remove user from users
-        del self.users[email]
-        self._save_users()
-        
-        # Remove user history
-        history_data = self._load_history()
-        if email in history_data:
-            del history_data[email]
-            self._save_history(history_data)
-        
-        # Remove user feedback
-        feedback_data = self._load_feedback()
-        if email in feedback_data:
-            del feedback_data[email]
-            self._save_feedback(feedback_data)
+        with self._lock:
+            if self._get_user(email) is None:
+                return False
+            
+            # Remove user, history and feedback from storage
+            self.storage.delete_user(email)
         
         return True
     
     def get_all_users(self) -> List[Dict[str, Any]]:
         """Get all users (for admin purposes)"""
         users_list = []
-        for email, user_data in self.users.items():
+        for email, user_data in self.storage.load_users().items():
             user_info = user_data.copy()
             user_info.pop("password", None)  # Remove password
             users_list.append(user_info)
@@ -244,13 +212,12 @@ class UserAuth:
     
     def get_user_stats(self, email: str) -> Dict[str, Any]:
         """Get user statistics"""
-        if email not in self.users:
+        if self._get_user(email) is None:
             return {}
         
-        history = self.get_user_history(email)
         feedback = self.get_user_feedback(email)
         
-        total_chats = len(history)
+        total_chats = self.count_user_history(email)
         total_feedback = len(feedback)
         positive_feedback = len([f for f in feedback if f.get("feedback") == "positive"])
         negative_feedback = len([f for f in feedback if f.get("feedback") == "negative"])
@@ -11,18 +11,47 @@ class Config:
     
     # Google Gemini Configuration
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
     
     # Anthropic Configuration
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+    ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
     
     # Hugging Face Configuration
     HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
+    HUGGINGFACE_BASE_URL = os.getenv("HUGGINGFACE_BASE_URL", "https://api-inference.huggingface.co")
+    
+    # HTTP Configuration (shared connection pool for all providers)
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
     
     # App Configuration
     APP_TITLE = "AI Multi-Modal Assistant"
     APP_VERSION = "1.0.0"
     
+    # User Data Storage
+    DATA_DIR = os.getenv("DATA_DIR", "user_data")
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite")  # "sqlite", "jsonl" or "json"
+    
+    # Model Request Execution
+    MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "8"))  # per provider type
+    MODEL_REQUEST_TIMEOUT = float(os.getenv("MODEL_REQUEST_TIMEOUT", "120"))
+    
+    # Provider Retries and Circuit Breaker
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per attempt
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))  # longer Retry-After waits fail instead
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+    
+    # Response Cache (only temperature-0 requests are cached)
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+    RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR")  # unset = memory only
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+    
     # Model Configuration
+    MODEL_CATALOG_PATH = os.getenv("MODEL_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.json"))
     DEFAULT_TEMPERATURE = 0.7
     DEFAULT_MAX_TOKENS = 1000
     
@@ -31,3 +60,40 @@ class Config:
     ALLOWED_IMAGE_TYPES = ["image/jpeg", "image/png", "image/gif"]
     ALLOWED_DOCUMENT_TYPES = ["application/pdf", "text/plain", "application/msword"]
     ALLOWED_EXCEL_TYPES = ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "application/vnd.ms-excel"]
+    
+    # Document Extraction budget (per uploaded document)
+    DOCUMENT_MAX_PAGES = int(os.getenv("DOCUMENT_MAX_PAGES", "200"))
+    DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(2 * 1024 * 1024)))  # of extracted text
+    
+    # Document Retrieval (only the chunks most relevant to a question are sent)
+    RETRIEVAL_CHUNK_CHARS = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "1500"))
+    RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "200"))
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "5"))
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "32"))  # indexed documents kept in memory
+    
+    # Spreadsheet Profiling (CSV and .xlsx files are read in chunks of rows)
+    PROFILE_CHUNK_ROWS = int(os.getenv("PROFILE_CHUNK_ROWS", "50000"))
+    PROFILE_SAMPLE_ROWS = int(os.getenv("PROFILE_SAMPLE_ROWS", "100000"))  # rows read by "Quick profile"
+    
+    # Image Uploads (downscaled and re-encoded before they are stored or sent)
+    IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "2048"))
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))  # JPEG/WebP quality
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    
+    # Processed Upload Cache (keyed by content hash and processing options)
+    FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "64"))
+    FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+    
+    # File Worker Pool (image decoding, document indexing and spreadsheet profiling; 0 runs them inline)
+    FILE_WORKERS = int(os.getenv("FILE_WORKERS", "2"))
+    FILE_JOB_TIMEOUT = float(os.getenv("FILE_JOB_TIMEOUT", "120"))  # seconds per file
+    FILE_WORKER_MEMORY = int(os.getenv("FILE_WORKER_MEMORY", str(4 * 1024 * 1024 * 1024)))  # address space per worker
+    FILE_SPOOL_BYTES = int(os.getenv("FILE_SPOOL_BYTES", str(1024 * 1024)))  # larger uploads reach workers via a mapped temp file
+    
+    # Spreadsheet Table Cache (parsed sheets kept as memory-mapped Arrow files; needs pyarrow, empty disables)
+    TABLE_CACHE_DIR = os.getenv("TABLE_CACHE_DIR", os.path.join(DATA_DIR, "tables"))
+    TABLE_CACHE_MAX_BYTES = int(os.getenv("TABLE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+    
+    # Spreadsheet Questions (the model plans a query, pandas runs it over the cached table)
+    TABLE_QUERY_PLAN_TOKENS = int(os.getenv("TABLE_QUERY_PLAN_TOKENS", "400"))
+    TABLE_QUERY_MAX_ROWS = int(os.getenv("TABLE_QUERY_MAX_ROWS", "50"))  # result rows sent to the model
@@ -0,0 +1,257 @@
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from config import Config
+from providers import ProviderError
+
+_DONE = object()
+
+
+class ModelJob:
+    """Handle for a model request running on the ExecutionEngine.
+
+    Text chunks are handed over through a queue, so the UI can render them
+    as they arrive. Abandoning the chunk iterator early (for example when
+    Streamlit stops the script because the user navigated away) cancels
+    the job. `provider` is the provider whose concurrency slot the job
+    holds or waits for; it changes when the job falls back to another one.
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.holding_slot = False
+        self.cancelled = threading.Event()
+        self.future: Optional[concurrent.futures.Future] = None
+        self._chunks: "queue.Queue" = queue.Queue()
+        self._finished = threading.Event()
+        self._finish_lock = threading.Lock()
+
+    def put(self, chunk: str):
+        if not self._finished.is_set():
+            self._chunks.put(chunk)
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Signal the end of the stream, optionally with an error; only the first call counts"""
+        with self._finish_lock:
+            if self._finished.is_set():
+                return
+            if error is not None:
+                self._chunks.put(error)
+            self._chunks.put(_DONE)
+            self._finished.set()
+
+    def cancel(self):
+        """Stop the job; a consumer still reading gets an error rather than a truncated text"""
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+        self.finish(ProviderError("Model request was cancelled"))
+
+    def done(self) -> bool:
+        return self._finished.is_set()
+
+    def iter_chunks(self) -> Iterator[str]:
+        """Yield text chunks until the job finishes; re-raises the job's error"""
+        completed = False
+        try:
+            while True:
+                item = self._chunks.get()
+                if item is _DONE:
+                    completed = True
+                    return
+                if isinstance(item, BaseException):
+                    completed = True
+                    raise item
+                yield item
+        finally:
+            if not completed:
+                self.cancel()
+
+
+class ExecutionEngine:
+    """Runs model requests on a background asyncio loop.
+
+    Each provider type gets its own concurrency limit, so a slow provider
+    queues its own requests without starving others. Blocking HTTP work
+    runs in a worker pool; the Streamlit script thread only consumes chunks.
+    A job's timeout runs from when a worker thread picks it up.
+    """
+
+    def __init__(self, providers: Iterable[str], max_concurrency: int = None, timeout: float = None,
+                 limits: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency or Config.MODEL_CONCURRENCY
+        self.timeout = timeout or Config.MODEL_REQUEST_TIMEOUT
+        self.limits = limits or {}
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="model-execution", daemon=True)
+        self._thread.start()
+
+        # One worker per concurrency slot, so every provider can run at its limit
+        self._executor = ThreadPoolExecutor(
+            max_workers=sum(self.limits.get(provider, self.max_concurrency) for provider in providers) or 1,
+            thread_name_prefix="model-call"
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # Jobs submitted and not yet finished, per provider
+        self._active: Dict[str, int] = {}
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        # Only called on the loop thread
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self.limits.get(provider, self.max_concurrency))
+        return self._semaphores[provider]
+
+    def load(self, provider: str) -> int:
+        """Number of queued or running jobs for a provider"""
+        return self._active.get(provider, 0)
+
+    def submit(self, provider: str, open_stream: Callable[[ModelJob], Iterable[str]]) -> ModelJob:
+        """Run `open_stream(job)` in the background and return a job that yields its chunks.
+
+        The job starts out holding a slot of `provider`; `open_stream` calls
+        switch() before calling any other provider.
+        """
+        job = ModelJob(provider)
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, open_stream), self.loop)
+        return job
+
+    def switch(self, job: ModelJob, provider: str):
+        """From the job's worker thread: move its slot to `provider`, waiting for one to free up.
+
+        Raises ProviderError if the job is cancelled or times out meanwhile.
+        """
+        if job.provider != provider:
+            asyncio.run_coroutine_threadsafe(self._move(job, provider), self.loop).result()
+
+    async def _take_slot(self, job: ModelJob, provider: str) -> bool:
+        """Wait for a slot of `provider`; False if the job finished while queued"""
+        self._active[provider] = self.load(provider) + 1
+        job.provider = provider
+        try:
+            await self._semaphore(provider).acquire()
+        except BaseException:
+            self._active[provider] -= 1
+            raise
+        if job.done():
+            self._semaphore(provider).release()
+            self._active[provider] -= 1
+            return False
+        job.holding_slot = True
+        return True
+
+    def _free_slot(self, job: ModelJob):
+        if job.holding_slot:
+            job.holding_slot = False
+            self._semaphore(job.provider).release()
+            self._active[job.provider] -= 1
+
+    async def _move(self, job: ModelJob, provider: str):
+        self._free_slot(job)
+        if not await self._take_slot(job, provider):
+            raise ProviderError("Model request was cancelled")
+
+    async def _run(self, job: ModelJob, open_stream: Callable[[ModelJob], Iterable[str]]):
+        try:
+            if not await self._take_slot(job, job.provider):
+                return
+            started = asyncio.Event()
+
+            def pump():
+                self.loop.call_soon_threadsafe(started.set)
+                self._pump(job, open_stream)
+
+            work = self.loop.run_in_executor(self._executor, pump)
+            # A fallback waiting for its provider's slot keeps a thread without
+            # holding a slot, so a job may still queue briefly for a worker
+            waiting = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait({work, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiting.cancel()
+            try:
+                await asyncio.wait_for(asyncio.shield(work), self.timeout)
+            except asyncio.TimeoutError:
+                job.cancelled.set()
+                job.finish(ProviderError(f"Model request timed out after {self.timeout:.0f}s"))
+                # Keep the slot until the worker notices the cancellation
+                await work
+        except asyncio.CancelledError:
+            job.cancelled.set()
+            raise
+        finally:
+            self._free_slot(job)
+            job.finish()
+
+    @staticmethod
+    def _pump(job: ModelJob, open_stream: Callable[[ModelJob], Iterable[str]]):
+        stream = None
+        if job.cancelled.is_set():
+            return  # cancelled while waiting for a worker thread
+        try:
+            stream = iter(open_stream(job))
+            for chunk in stream:
+                if job.cancelled.is_set():
+                    return
+                job.put(chunk)
+        except Exception as e:
+            job.finish(e)
+        finally:
+            # Closing the generator releases its HTTP connection right away
+            if hasattr(stream, "close"):
+                stream.close()
+
+
+def _close(iterator: Iterator):
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        try:
+            close()
+        except ValueError:
+            pass  # running in its drain thread, which closes it once the current chunk arrives
+
+
+def merge_streams(streams: Dict[str, Iterable[str]]) -> Iterator[Tuple[str, Any]]:
+    """Interleave several chunk streams in arrival order.
+
+    Yields (key, chunk) pairs. Each stream ends with (key, None), or with
+    (key, error) if it raised. Every stream is drained by its own thread,
+    so a slow model never holds up the others. When the consumer stops
+    early, the streams are closed, which cancels their jobs.
+    """
+    events: "queue.Queue" = queue.Queue()
+    stopped = threading.Event()
+    iterators = {key: iter(stream) for key, stream in streams.items()}
+
+    def drain(key: str, iterator: Iterator[str]):
+        try:
+            for chunk in iterator:
+                if stopped.is_set():
+                    break
+                events.put((key, chunk))
+        except Exception as e:
+            events.put((key, e))
+        else:
+            events.put((key, None))
+        finally:
+            if stopped.is_set():
+                _close(iterator)
+
+    for key, iterator in iterators.items():
+        threading.Thread(target=drain, args=(key, iterator), name="merge-stream", daemon=True).start()
+
+    remaining = len(iterators)
+    try:
+        while remaining:
+            key, item = events.get()
+            if item is None or isinstance(item, BaseException):
+                remaining -= 1
+            yield key, item
+    finally:
+        stopped.set()
+        for iterator in iterators.values():
+            _close(iterator)
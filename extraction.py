@@ -0,0 +1,113 @@
+import codecs
+import zipfile
+from typing import BinaryIO, Iterator, Optional
+from xml.etree import ElementTree
+
+from config import Config
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class ExtractionError(Exception):
+    """Raised when a document cannot be read as its extension claims"""
+
+
+class TextExtractor:
+    """Streams the text of an uploaded document chunk by chunk.
+
+    PDFs are read a page at a time with PyPDF2, DOCX paragraphs are parsed
+    incrementally from the zip's XML, and plain text is decoded in blocks.
+    Extraction stops after `max_pages` pages or `max_bytes` bytes of text;
+    `pages`, `bytes_read` and `truncated` describe what was read once the
+    iterator is exhausted.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, max_pages: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_pages = max_pages or Config.DOCUMENT_MAX_PAGES
+        self.max_bytes = max_bytes or Config.DOCUMENT_MAX_BYTES
+        self.pages = 0
+        self.bytes_read = 0
+        self.truncated = False
+
+    def iter_text(self, file: BinaryIO, extension: str) -> Iterator[str]:
+        """Yield text chunks from `file`, stopping at the page and byte budget"""
+        if extension == ".pdf":
+            chunks = self._iter_pdf(file)
+        elif extension == ".docx":
+            chunks = self._iter_docx(file)
+        elif extension == ".doc":
+            raise ExtractionError("Legacy .doc files are not supported; save the document as .docx")
+        else:
+            chunks = self._iter_plain(file)
+
+        for chunk in chunks:
+            size = len(chunk.encode("utf-8"))
+            if self.bytes_read + size > self.max_bytes:
+                remaining = self.max_bytes - self.bytes_read
+                # Cut on a character boundary
+                yield chunk.encode("utf-8")[:remaining].decode("utf-8", errors="ignore")
+                self.bytes_read = self.max_bytes
+                self.truncated = True
+                chunks.close()
+                return
+            self.bytes_read += size
+            yield chunk
+
+    def _iter_pdf(self, file: BinaryIO) -> Iterator[str]:
+        from PyPDF2 import PdfReader
+        from PyPDF2.errors import PdfReadError
+
+        try:
+            reader = PdfReader(file)
+            if reader.is_encrypted and not reader.decrypt(""):
+                raise ExtractionError("The PDF is password protected")
+            # Pages are parsed on access, so only the ones read are loaded
+            for page in reader.pages:
+                if self.pages >= self.max_pages:
+                    self.truncated = True
+                    return
+                self.pages += 1
+                text = page.extract_text() or ""
+                if text:
+                    yield text + "\n\n"
+        except PdfReadError as e:
+            raise ExtractionError(f"Could not read PDF: {e}") from e
+
+    def _iter_docx(self, file: BinaryIO) -> Iterator[str]:
+        try:
+            archive = zipfile.ZipFile(file)
+            document = archive.open("word/document.xml")
+        except (zipfile.BadZipFile, KeyError) as e:
+            raise ExtractionError("Not a valid .docx file") from e
+
+        # DOCX has no fixed pages; count the breaks Word recorded when it last laid the text out
+        self.pages = 1
+        with archive, document:
+            try:
+                for event, element in ElementTree.iterparse(document, events=("end",)):
+                    if element.tag == f"{_W}lastRenderedPageBreak" or (
+                            element.tag == f"{_W}br" and element.get(f"{_W}type") == "page"):
+                        if self.pages >= self.max_pages:
+                            self.truncated = True
+                            return
+                        self.pages += 1
+                    elif element.tag == f"{_W}p":
+                        text = "".join(node.text or "" for node in element.iter(f"{_W}t"))
+                        # Free parsed paragraphs as we go
+                        element.clear()
+                        if text:
+                            yield text + "\n"
+            except ElementTree.ParseError as e:
+                raise ExtractionError(f"Could not parse .docx XML: {e}") from e
+
+    def _iter_plain(self, file: BinaryIO) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while True:
+            block = file.read(self.BLOCK_SIZE)
+            text = decoder.decode(block, final=not block)
+            if text:
+                yield text
+            if not block:
+                return
@@ -0,0 +1,62 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from config import Config
+
+
+class ProcessedFileCache:
+    """LRU of FileProcessor results keyed by upload content hash and processing options.
+
+    Bounded both by entry count and by the approximate size of the cached
+    results, so a few large image payloads cannot crowd out memory.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 128 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        """A copy of the cached result, so callers may add fields to it"""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                return None
+            self._entries.move_to_end(key)
+            return dict(result)
+
+    def put(self, key: Hashable, result: Dict[str, Any]):
+        size = len(json.dumps(result, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = dict(result)
+            self._sizes[key] = size
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        del self._entries[key]
+        self._bytes -= self._sizes.pop(key)
+
+
+_file_cache = None
+_file_cache_lock = threading.Lock()
+
+
+def get_file_cache() -> ProcessedFileCache:
+    """Process-wide cache of processed uploads, shared by every session"""
+    global _file_cache
+    if _file_cache is None:
+        with _file_cache_lock:
+            if _file_cache is None:
+                _file_cache = ProcessedFileCache(Config.FILE_CACHE_SIZE, Config.FILE_CACHE_MAX_BYTES)
+    return _file_cache
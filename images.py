@@ -0,0 +1,173 @@
+import io
+import base64
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Any, NamedTuple, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+from config import Config
+
+
+class ImageTarget(NamedTuple):
+    """Largest image worth sending to a provider, and how to encode it"""
+    max_side: int
+    max_pixels: int
+    format: str
+
+
+# Providers downscale anything bigger themselves, so larger uploads only cost bandwidth and tokens
+PROVIDER_IMAGE_TARGETS = {
+    "openai": ImageTarget(max_side=2048, max_pixels=768 * 2048, format="JPEG"),
+    "anthropic": ImageTarget(max_side=1568, max_pixels=1568 * 728, format="JPEG"),
+    "gemini": ImageTarget(max_side=3072, max_pixels=3072 * 3072, format="WEBP"),
+}
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+
+
+def load_image(source: Union[bytes, BinaryIO], max_side: int) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode an image (bytes or a binary file) at no more than `max_side` pixels per side; returns it and its original size.
+
+    JPEGs are decoded at a reduced scale straight from the file (draft
+    mode), so a large photo is never fully decoded.
+    """
+    image = Image.open(source if hasattr(source, "read") else io.BytesIO(source))
+    original_size = image.size
+    image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image, original_size
+
+
+def fit_pixels(image: Image.Image, max_side: int, max_pixels: int) -> Image.Image:
+    """Downscale so neither side exceeds `max_side` and the area stays under `max_pixels`"""
+    width, height = image.size
+    scale = min(1.0, max_side / max(width, height), (max_pixels / (width * height)) ** 0.5)
+    if scale < 1.0:
+        image = image.resize((max(int(width * scale), 1), max(int(height * scale), 1)), Image.LANCZOS)
+    return image
+
+
+def _save_image(image: Image.Image, image_format: str, quality: int = None) -> Tuple[io.BytesIO, str]:
+    quality = quality or Config.IMAGE_QUALITY
+    if _has_alpha(image):
+        if image_format == "JPEG":
+            image_format = "PNG"
+        image = image.convert("RGBA")
+    else:
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    return buffer, MIME_TYPES[image_format]
+
+
+def encode_image(image: Image.Image, image_format: str, quality: int = None) -> Tuple[bytes, str]:
+    """Encode as JPEG or WebP, returning the bytes and MIME type.
+
+    JPEG cannot hold transparency, so such images become PNG instead.
+    """
+    buffer, mime_type = _save_image(image, image_format, quality)
+    return buffer.getvalue(), mime_type
+
+
+def process_image(file: BinaryIO, max_side: int) -> Dict[str, Any]:
+    """Decode an upload at reduced size and keep a compact JPEG (or PNG if transparent)"""
+    image, original_size = load_image(file, max_side)
+    buffer, mime_type = _save_image(image, "JPEG")
+    with buffer.getbuffer() as encoded:
+        data = base64.b64encode(encoded).decode("ascii")
+    return {
+        "dimensions": original_size,
+        "mode": image.mode,
+        "encoded_dimensions": image.size,
+        "mime_type": mime_type,
+        "base64": data
+    }
+
+
+class ImageCache:
+    """LRU of encoded images keyed by (content hash, variant), bounded by total bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[str, str], entry: Dict[str, Any]):
+        size = len(entry["data"])
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)["data"])
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["data"])
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Process-wide cache of thumbnails and provider encodings"""
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache(Config.IMAGE_CACHE_MAX_BYTES)
+    return _image_cache
+
+
+def thumbnail(source: Union[bytes, BinaryIO], content_hash: str, size: int = 512) -> bytes:
+    """Preview of an upload at most `size` pixels per side, cached by content hash"""
+    cache = get_image_cache()
+    key = (content_hash, f"thumbnail-{size}")
+    entry = cache.get(key)
+    if entry is None:
+        image, _ = load_image(source, size)
+        entry = {"data": encode_image(image, "JPEG")[0]}
+        cache.put(key, entry)
+    return entry["data"]
+
+
+def image_for_provider(image_info: Dict[str, Any], provider: str) -> Dict[str, str]:
+    """The processed upload re-encoded for a provider's limits, as {"base64", "mime_type"}"""
+    original = {"base64": image_info["base64"], "mime_type": image_info.get("mime_type", "image/png")}
+    target = PROVIDER_IMAGE_TARGETS.get(provider)
+    if target is None:
+        return original
+
+    cache = get_image_cache()
+    key = (image_info.get("sha256", ""), provider)
+    entry = cache.get(key)
+    if entry is None:
+        data = base64.b64decode(image_info["base64"])
+        image = Image.open(io.BytesIO(data))
+        resized = fit_pixels(image, target.max_side, target.max_pixels)
+        if resized is image and original["mime_type"] == MIME_TYPES[target.format]:
+            # Already within limits; re-encoding would only lose quality
+            entry = dict(original, data=data)
+        else:
+            data, mime_type = encode_image(resized, target.format)
+            entry = {"data": data, "base64": base64.b64encode(data).decode(), "mime_type": mime_type}
+        if image_info.get("sha256"):
+            cache.put(key, entry)
+    return {"base64": entry["base64"], "mime_type": entry["mime_type"]}
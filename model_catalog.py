@@ -0,0 +1,113 @@
+import json
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, List, Mapping, Optional, Tuple
+
+ROUTING_POLICIES = {"fixed", "least_loaded"}
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Immutable description of one model in the catalog"""
+
+    __slots__ = (
+        "name", "category", "type", "endpoint", "model_id", "api_key_required",
+        "description", "icon", "max_tokens", "context_window", "temperature", "fallbacks", "routing"
+    )
+
+    name: str
+    category: str
+    type: str
+    endpoint: str
+    model_id: str
+    api_key_required: bool
+    description: str
+    icon: str
+    max_tokens: int
+    # Prompt plus response tokens the model accepts
+    context_window: int
+    temperature: float
+    # Equivalent models to try when this one is rate-limited or down
+    fallbacks: Tuple[str, ...]
+    # "fixed" tries this model first; "least_loaded" starts with the least busy of it and its fallbacks
+    routing: str
+
+    @classmethod
+    def from_dict(cls, name: str, category: str, data: Dict[str, Any]) -> "ModelSpec":
+        return cls(
+            name=name,
+            category=category,
+            type=data["type"],
+            endpoint=data.get("endpoint", ""),
+            model_id=data.get("model_id", ""),
+            api_key_required=bool(data.get("api_key_required", False)),
+            description=data.get("description", ""),
+            icon=data.get("icon", "🤖"),
+            max_tokens=int(data.get("max_tokens", 1000)),
+            context_window=int(data.get("context_window", 4096)),
+            temperature=float(data.get("temperature", 0.7)),
+            fallbacks=tuple(data.get("fallbacks", ())),
+            routing=data.get("routing", "fixed")
+        )
+
+
+class ModelCatalog:
+    """Read-only set of ModelSpecs indexed by name, provider type and category"""
+
+    def __init__(self, specs: Iterable[ModelSpec]):
+        by_name: Dict[str, ModelSpec] = {}
+        by_type: Dict[str, List[ModelSpec]] = {}
+        by_category: Dict[str, List[ModelSpec]] = {}
+        for spec in specs:
+            if spec.name in by_name:
+                raise ValueError(f"Duplicate model name in catalog: {spec.name}")
+            by_name[spec.name] = spec
+            by_type.setdefault(spec.type, []).append(spec)
+            by_category.setdefault(spec.category, []).append(spec)
+
+        for spec in by_name.values():
+            unknown = [name for name in spec.fallbacks if name not in by_name]
+            if unknown:
+                raise ValueError(f"Unknown fallback models for {spec.name}: {', '.join(unknown)}")
+            if spec.routing not in ROUTING_POLICIES:
+                raise ValueError(f"Unknown routing policy for {spec.name}: {spec.routing}")
+
+        self._by_name: Mapping[str, ModelSpec] = MappingProxyType(by_name)
+        self._by_type: Mapping[str, Tuple[ModelSpec, ...]] = MappingProxyType(
+            {t: tuple(group) for t, group in by_type.items()}
+        )
+        self._by_category: Mapping[str, Tuple[ModelSpec, ...]] = MappingProxyType(
+            {c: tuple(group) for c, group in by_category.items()}
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "ModelCatalog":
+        """Load a catalog from JSON shaped as {category: {model name: settings}}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(
+            ModelSpec.from_dict(name, category, settings)
+            for category, models in data.items()
+            for name, settings in models.items()
+        )
+
+    def get(self, name: str) -> Optional[ModelSpec]:
+        return self._by_name.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def names(self) -> List[str]:
+        return list(self._by_name)
+
+    def by_type(self, model_type: str) -> Tuple[ModelSpec, ...]:
+        return self._by_type.get(model_type, ())
+
+    def categories(self) -> List[str]:
+        return list(self._by_category)
+
+    def in_category(self, category: str) -> Tuple[ModelSpec, ...]:
+        return self._by_category.get(category, ())
@@ -0,0 +1,236 @@
+import io
+import os
+import mmap
+import tempfile
+import threading
+import multiprocessing
+from typing import Any, BinaryIO, Callable, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows has no resource limits
+    resource = None
+
+from config import Config
+
+
+class FileJobError(Exception):
+    """Raised when a file job times out, runs out of memory or kills its worker"""
+
+
+class BufferFile(io.RawIOBase):
+    """Read-only, seekable file over a memoryview or mmap, so readers never need a copy of the whole upload"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+        self._position = 0
+
+    @classmethod
+    def map(cls, path: str) -> "BufferFile":
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        start = min(self._position, len(self._view))
+        end = len(self._view) if size is None or size < 0 else min(start + size, len(self._view))
+        self._position = max(self._position, end)
+        return self._view[start:end].tobytes()
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+            if isinstance(self._buffer, mmap.mmap):
+                self._buffer.close()
+        super().close()
+
+
+class SpooledUpload:
+    """Picklable handle on an upload for a worker job.
+
+    Small uploads travel with the job; larger ones are written once to a
+    temp file that the worker memory-maps, instead of being pickled
+    through the pool's pipe.
+    """
+
+    def __init__(self, data: memoryview):
+        self.data: Optional[bytes] = None
+        self.path: Optional[str] = None
+        if len(data) < Config.FILE_SPOOL_BYTES:
+            self.data = bytes(data)
+        else:
+            with tempfile.NamedTemporaryFile(prefix="upload-", delete=False) as file:
+                file.write(data)
+                self.path = file.name
+
+    def open(self) -> BinaryIO:
+        return BufferFile.map(self.path) if self.path else BufferFile(self.data)
+
+    def discard(self):
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def _run_on_upload(fn: Callable[..., Any], upload: SpooledUpload, *args) -> Any:
+    with upload.open() as file:
+        return fn(file, *args)
+
+
+def _limit_memory(max_bytes: int):
+    """Cap the worker's address space so one huge file fails alone"""
+    if resource is not None and max_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+def _worker_main(conn, max_bytes: int):
+    """Worker process loop: run (fn, args) jobs from the pipe and send back (ok, result or exception)"""
+    _limit_memory(max_bytes)
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            reply = (True, fn(*args))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            conn.send((False, FileJobError(f"The file processing result could not be returned: {e}")))
+
+
+class _Worker:
+    """One worker process and the pipe it takes jobs from"""
+
+    def __init__(self, context, max_bytes: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, max_bytes), name="file-worker", daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class FileWorkerPool:
+    """Long-lived worker processes for CPU-heavy file processing.
+
+    Each job gets a worker to itself, and its timeout starts only once
+    the worker has it, so time spent queued behind other uploads does not
+    count. A job that overruns or crashes costs only its own worker, which
+    is replaced on demand; other jobs keep running.
+    """
+
+    def __init__(self, workers: int, max_bytes: int):
+        self.max_bytes = max_bytes
+        # Forking a process that runs threads (Streamlit, the model engine) is unsafe
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.Semaphore(workers)
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+        return _Worker(self._context, self.max_bytes)
+
+    def _checkin(self, worker: _Worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def run(self, fn: Callable[..., Any], args: tuple, timeout: float) -> Any:
+        with self._slots:
+            worker = self._checkout()
+            healthy = False
+            try:
+                worker.conn.send((fn, args))
+                if not worker.conn.poll(timeout):
+                    raise FileJobError(f"Processing the file took longer than {timeout:.0f}s")
+                ok, value = worker.conn.recv()
+                healthy = True
+            except (EOFError, OSError):
+                raise FileJobError("The file processing worker crashed")
+            finally:
+                if healthy:
+                    self._checkin(worker)
+                else:
+                    worker.kill()
+        if ok:
+            return value
+        if isinstance(value, MemoryError):
+            raise FileJobError("The file needs more memory to process than the server allows")
+        raise value
+
+
+_pool: Optional[FileWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_file_pool() -> FileWorkerPool:
+    """Worker pool shared by every session, configured from Config"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = FileWorkerPool(Config.FILE_WORKERS, Config.FILE_WORKER_MEMORY)
+    return _pool
+
+
+def run_file_job(fn: Callable[..., Any], *args, timeout: float = None) -> Any:
+    """Run `fn(*args)` in the file worker pool and return its result.
+
+    `fn` must be a module-level function taking and returning picklable
+    values. With FILE_WORKERS set to 0 the job runs inline instead.
+    Raises FileJobError if the job runs longer than `timeout` once
+    started, exceeds the worker memory cap or kills its worker;
+    exceptions raised by `fn` itself propagate unchanged.
+    """
+    if not Config.FILE_WORKERS:
+        return fn(*args)
+    return get_file_pool().run(fn, args, timeout or Config.FILE_JOB_TIMEOUT or None)
+
+
+def run_upload_job(fn: Callable[..., Any], data: memoryview, *args, timeout: float = None) -> Any:
+    """Run `fn(file, *args)` on an upload's bytes in the file worker pool.
+
+    `file` is a read-only binary file over the bytes; inline (FILE_WORKERS
+    set to 0) it reads `data` in place.
+    """
+    if not Config.FILE_WORKERS:
+        with BufferFile(data) as file:
+            return fn(file, *args)
+
+    upload = SpooledUpload(data)
+    try:
+        return run_file_job(_run_on_upload, fn, upload, *args, timeout=timeout)
+    finally:
+        upload.discard()
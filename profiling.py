@@ -0,0 +1,271 @@
+import random
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from table_store import TableStore, get_table_store
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class NumericAccumulator:
+    """Mergeable count, mean, variance, min and max, plus a fixed-size sample for quantiles.
+
+    Variance uses Chan's parallel formula, so partial results from any
+    number of chunks combine exactly; quantiles are approximate, read from
+    a uniform reservoir sample of at most `sample_size` values.
+    """
+
+    def __init__(self, sample_size: int = 2048):
+        self.sample_size = sample_size
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sample = np.empty(0)
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, sample_size: int = 2048) -> "NumericAccumulator":
+        acc = cls(sample_size)
+        if len(values):
+            acc.count = len(values)
+            acc.mean = float(values.mean())
+            acc.m2 = float(((values - acc.mean) ** 2).sum())
+            acc.min = float(values.min())
+            acc.max = float(values.max())
+            acc.sample = values if len(values) <= sample_size else np.random.choice(values, sample_size, replace=False)
+        return acc
+
+    def merge(self, other: "NumericAccumulator"):
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / total
+        self.mean += delta * other.count / total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sample = self._merge_samples(other, total)
+        self.count = total
+
+    def _merge_samples(self, other: "NumericAccumulator", total: int) -> np.ndarray:
+        if len(self.sample) + len(other.sample) <= self.sample_size:
+            return np.concatenate([self.sample, other.sample])
+        # Draw from each side in proportion to the rows it stands for
+        from_self = min(np.random.binomial(self.sample_size, self.count / total), len(self.sample))
+        from_other = min(self.sample_size - from_self, len(other.sample))
+        return np.concatenate([
+            np.random.choice(self.sample, from_self, replace=False),
+            np.random.choice(other.sample, from_other, replace=False)
+        ])
+
+    def summary(self) -> Dict[str, float]:
+        """Statistics shaped like a DataFrame.describe() column"""
+        if not self.count:
+            return {"count": 0}
+        stats = {
+            "count": self.count,
+            "mean": self.mean,
+            "std": float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float("nan"),
+            "min": self.min
+        }
+        for q, value in zip(QUANTILES, np.quantile(self.sample, QUANTILES)):
+            stats[f"{q:.0%}"] = float(value)
+        stats["max"] = self.max
+        return stats
+
+
+class TopKAccumulator:
+    """Mergeable frequent-values summary (Misra-Gries) keeping at most `capacity` counters.
+
+    Any value making up more than 1/capacity of the rows is guaranteed to
+    be kept; counts are lower bounds.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+
+    def update(self, value_counts: pd.Series):
+        if len(value_counts) > self.capacity:
+            # Reduce the chunk to its own summary first, so at most `capacity` values are merged
+            value_counts = value_counts.sort_values(ascending=False)
+            floor = value_counts.iloc[self.capacity]
+            value_counts = value_counts[value_counts > floor] - floor
+        for value, count in value_counts.items():
+            self.counts[value] = self.counts.get(value, 0) + int(count)
+        if len(self.counts) > self.capacity:
+            # Subtract the (capacity + 1)-th largest count from every counter
+            floor = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = {v: c - floor for v, c in self.counts.items() if c > floor}
+
+    def merge(self, other: "TopKAccumulator"):
+        self.update(pd.Series(other.counts, dtype="int64"))
+
+    def top(self, k: int = 5) -> Dict[str, int]:
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return {str(value): count for value, count in ranked}
+
+
+class ColumnProfile:
+    def __init__(self):
+        self.nulls = 0
+        self.numeric = NumericAccumulator()
+        self.values = TopKAccumulator()
+        self.non_numeric = False
+
+    def update(self, series: pd.Series):
+        self.nulls += int(series.isna().sum())
+        present = series.dropna()
+        if pd.api.types.is_numeric_dtype(present) and not pd.api.types.is_bool_dtype(present):
+            self.numeric.merge(NumericAccumulator.from_values(present.to_numpy(dtype=float)))
+        else:
+            # Frequent values are only reported for non-numeric columns, so only counted for them
+            self.non_numeric = True
+            self.values.update(present.value_counts(sort=False))
+
+    def merge(self, other: "ColumnProfile"):
+        self.nulls += other.nulls
+        self.numeric.merge(other.numeric)
+        self.values.merge(other.values)
+        self.non_numeric = self.non_numeric or other.non_numeric
+
+
+class SpreadsheetProfiler:
+    """Profiles a table chunk by chunk, so memory stays bounded whatever the file size"""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, ColumnProfile] = {}
+        self.preview: Optional[pd.DataFrame] = None
+
+    def update(self, chunk: pd.DataFrame):
+        if self.preview is None:
+            self.preview = chunk.head()
+        self.rows += len(chunk)
+        for name in chunk.columns:
+            self.columns.setdefault(str(name), ColumnProfile()).update(chunk[name])
+
+    def merge(self, other: "SpreadsheetProfiler"):
+        if self.preview is None:
+            self.preview = other.preview
+        self.rows += other.rows
+        for name, column in other.columns.items():
+            self.columns.setdefault(name, ColumnProfile()).merge(column)
+
+    def report(self) -> Dict[str, Any]:
+        """Keys match what FileProcessor reported from a full DataFrame, plus top values and null counts"""
+        numeric = {n: c for n, c in self.columns.items() if not c.non_numeric and c.numeric.count}
+        return {
+            "rows": self.rows,
+            "columns": len(self.columns),
+            "column_names": list(self.columns),
+            "data_preview": self.preview.to_dict() if self.preview is not None else {},
+            "summary_stats": {n: c.numeric.summary() for n, c in numeric.items()},
+            "top_values": {n: c.values.top() for n, c in self.columns.items() if n not in numeric},
+            "null_counts": {n: c.nulls for n, c in self.columns.items()}
+        }
+
+
+def _csv_sample_rate(file: BinaryIO, sample_rows: int) -> float:
+    """Fraction of rows to keep for about `sample_rows` rows, estimated from the first lines' size"""
+    start = file.tell()
+    head = file.read(64 * 1024)
+    file.seek(0, 2)
+    size = file.tell() - start
+    file.seek(start)
+    lines = max(head.count(b"\n"), 1)
+    estimated_rows = size * lines / max(len(head), 1)
+    return min(sample_rows / max(estimated_rows, 1), 1.0)
+
+
+def iter_csv_chunks(file: BinaryIO, chunk_rows: int = None, sample_rate: float = 1.0) -> Iterator[pd.DataFrame]:
+    """Read a CSV in chunks, keeping each data row with probability `sample_rate`"""
+    chunk_rows = chunk_rows or Config.PROFILE_CHUNK_ROWS
+    skiprows = None
+    if sample_rate < 1.0:
+        # Skipped lines are never parsed; row 0 is the header
+        skiprows = lambda i: i > 0 and random.random() > sample_rate
+    yield from pd.read_csv(file, chunksize=chunk_rows, skiprows=skiprows)
+
+
+def iter_excel_chunks(file: BinaryIO, extension: str, chunk_rows: int = None) -> Iterator[pd.DataFrame]:
+    """Read the first sheet of a workbook in chunks of rows"""
+    chunk_rows = chunk_rows or Config.PROFILE_CHUNK_ROWS
+    if extension != ".xlsx":
+        # xlrd cannot stream .xls files; they are small by nature of the format (65,536 rows max)
+        yield pd.read_excel(file)
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        batch: List[tuple] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns).infer_objects()
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns).infer_objects()
+    finally:
+        workbook.close()
+
+
+def _read_chunks(file: BinaryIO, extension: str, sample_rate: float = 1.0) -> Iterator[pd.DataFrame]:
+    if extension == ".csv":
+        return iter_csv_chunks(file, sample_rate=sample_rate)
+    return iter_excel_chunks(file, extension)
+
+
+def _stored_chunks(store: TableStore, file: BinaryIO, extension: str, content_hash: str) -> Iterator[pd.DataFrame]:
+    """Chunks read back from the table store, parsing the upload into it first if needed"""
+    if not store.has(content_hash):
+        start = file.tell()
+
+        def read_chunks() -> Iterator[pd.DataFrame]:
+            file.seek(start)
+            return _read_chunks(file, extension)
+
+        store.put(content_hash, read_chunks)
+    return store.iter_chunks(content_hash)
+
+
+def profile_spreadsheet(file: BinaryIO, extension: str, sample_rows: Optional[int] = None,
+                        content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Profile a CSV or Excel upload in bounded memory.
+
+    With `content_hash` the sheet is parsed once into the table store and
+    profiled from there; later calls for the same content skip parsing.
+    With `sample_rows`, a CSV not yet in the store is profiled from a
+    random sample of about that many rows instead; "rows" then counts the
+    sampled rows and "estimated_rows" the whole file.
+    """
+    profiler = SpreadsheetProfiler()
+    sample_rate = 1.0
+    store = get_table_store() if content_hash else None
+    if store is not None and sample_rows and extension == ".csv" and not store.has(content_hash):
+        store = None  # a quick profile samples the CSV instead of parsing all of it
+    if store is not None:
+        chunks = _stored_chunks(store, file, extension, content_hash)
+    else:
+        if sample_rows and extension == ".csv":
+            sample_rate = _csv_sample_rate(file, sample_rows)
+        chunks = _read_chunks(file, extension, sample_rate)
+    for chunk in chunks:
+        profiler.update(chunk)
+
+    report = profiler.report()
+    report["sampled"] = sample_rate < 1.0
+    if report["sampled"]:
+        report["estimated_rows"] = int(profiler.rows / sample_rate)
+    return report
@@ -0,0 +1,359 @@
+import json
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from model_catalog import ModelSpec
+
+
+class ProviderError(Exception):
+    """Raised when a provider request fails or returns an unexpected payload.
+
+    `retryable` marks transient failures (rate limits, 5xx, network errors)
+    that may succeed on a later attempt; `retry_after` is the wait in
+    seconds the provider asked for, if any.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None, retryable: Optional[bool] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        if retryable is None:
+            retryable = status_code is not None and (status_code in (408, 429) or status_code >= 500)
+        self.retryable = retryable
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _status_error(url: str, response: requests.Response) -> ProviderError:
+    return ProviderError(
+        f"{response.status_code} from {url}: {response.text[:500]}",
+        status_code=response.status_code,
+        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+    )
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide HTTP session so connections (and TLS sessions) are reused"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=Config.HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def iter_sse(response: requests.Response) -> Iterator[Tuple[str, str]]:
+    """Parse a server-sent events stream into (event, data) pairs"""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            # A blank line terminates the current event
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue  # comment / keep-alive
+        else:
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class ProviderClient:
+    """Base class for a provider's chat API.
+
+    Subclasses translate a prompt into the provider's wire format and back.
+    `base_url` replaces DEFAULT_BASE_URL in catalog endpoints, which lets the
+    clients run against a local stub server.
+    """
+
+    DEFAULT_BASE_URL = ""
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 session: Optional[requests.Session] = None, timeout: float = None):
+        self.base_url = (base_url or self.DEFAULT_BASE_URL).rstrip("/")
+        self.api_key = api_key
+        self.session = session or get_http_session()
+        self.timeout = timeout or Config.HTTP_TIMEOUT
+
+    def resolve_url(self, endpoint: str) -> str:
+        if endpoint.startswith(self.DEFAULT_BASE_URL):
+            return self.base_url + endpoint[len(self.DEFAULT_BASE_URL):]
+        return endpoint
+
+    def build_request(self, model: ModelSpec, prompt: Dict[str, Any], api_key: Optional[str],
+                      temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Return (url, headers, json body) for a completion request"""
+        raise NotImplementedError
+
+    def parse_response(self, data: Any) -> str:
+        """Extract the generated text from a provider response body"""
+        raise NotImplementedError
+
+    def parse_usage(self, data: Any) -> Dict[str, int]:
+        return {}
+
+    def build_stream_request(self, model: ModelSpec, prompt: Dict[str, Any], api_key: Optional[str],
+                             temperature: float, max_tokens: int) -> Tuple[str, Dict, Dict]:
+        """Return (url, headers, json body) for a streaming request"""
+        url, headers, body = self.build_request(model, prompt, api_key, temperature, max_tokens)
+        body["stream"] = True
+        return url, headers, body
+
+    def parse_stream_event(self, event: str, data: str) -> Optional[str]:
+        """Extract the text delta from one SSE event, or None if it carries no text"""
+        raise NotImplementedError
+
+    def complete(self, model: ModelSpec, prompt: Dict[str, Any], api_key: Optional[str],
+                 temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Send one completion request and return its text and token usage.
+
+        `prompt` holds "system" and "text" strings and optionally "image",
+        a dict with "base64" and "mime_type".
+        """
+        url, headers, body = self.build_request(
+            model, prompt, api_key or self.api_key, temperature, max_tokens
+        )
+        try:
+            response = self.session.post(url, headers=headers, json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ProviderError(f"Request to {url} failed: {e}", retryable=True) from e
+
+        if response.status_code >= 400:
+            raise _status_error(url, response)
+
+        try:
+            data = response.json()
+            return {"content": self.parse_response(data), "usage": self.parse_usage(data)}
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise ProviderError(f"Unexpected response from {url}: {e}") from e
+
+    def stream(self, model: ModelSpec, prompt: Dict[str, Any], api_key: Optional[str],
+               temperature: float, max_tokens: int) -> Iterator[str]:
+        """Start a streaming completion and return an iterator of text chunks.
+
+        The request is sent and its status checked before returning, so
+        connection and HTTP errors surface here rather than mid-stream.
+        """
+        url, headers, body = self.build_stream_request(
+            model, prompt, api_key or self.api_key, temperature, max_tokens
+        )
+        try:
+            response = self.session.post(url, headers=headers, json=body, timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise ProviderError(f"Request to {url} failed: {e}", retryable=True) from e
+
+        if response.status_code >= 400:
+            error = _status_error(url, response)
+            response.close()
+            raise error
+
+        response.encoding = "utf-8"
+        return self._iter_stream(url, response)
+
+    def _iter_stream(self, url: str, response: requests.Response) -> Iterator[str]:
+        with response:
+            try:
+                for event, data in iter_sse(response):
+                    text = self.parse_stream_event(event, data)
+                    if text:
+                        yield text
+            except requests.RequestException as e:
+                raise ProviderError(f"Stream from {url} failed: {e}") from e
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                raise ProviderError(f"Unexpected stream event from {url}: {e}") from e
+
+
+class OpenAIClient(ProviderClient):
+    DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+    def build_request(self, model, prompt, api_key, temperature, max_tokens):
+        user_content: Any = prompt["text"]
+        if prompt.get("image"):
+            image = prompt["image"]
+            user_content = [
+                {"type": "text", "text": prompt["text"]},
+                {"type": "image_url",
+                 "image_url": {"url": f"data:{image['mime_type']};base64,{image['base64']}"}}
+            ]
+
+        body = {
+            "model": model.model_id,
+            "messages": [
+                {"role": "system", "content": prompt["system"]},
+                {"role": "user", "content": user_content}
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        headers = {"Authorization": f"Bearer {api_key}"}
+        return self.resolve_url(model.endpoint), headers, body
+
+    def parse_response(self, data):
+        return data["choices"][0]["message"]["content"]
+
+    def parse_usage(self, data):
+        usage = data.get("usage") or {}
+        return {"input_tokens": usage.get("prompt_tokens", 0),
+                "output_tokens": usage.get("completion_tokens", 0)}
+
+    def parse_stream_event(self, event, data):
+        if data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+
+class AnthropicClient(ProviderClient):
+    DEFAULT_BASE_URL = "https://api.anthropic.com"
+    API_VERSION = "2023-06-01"
+
+    def build_request(self, model, prompt, api_key, temperature, max_tokens):
+        content = [{"type": "text", "text": prompt["text"]}]
+        if prompt.get("image"):
+            image = prompt["image"]
+            content.insert(0, {
+                "type": "image",
+                "source": {"type": "base64", "media_type": image["mime_type"], "data": image["base64"]}
+            })
+
+        body = {
+            "model": model.model_id,
+            "system": prompt["system"],
+            "messages": [{"role": "user", "content": content}],
+            # Anthropic accepts temperatures in [0, 1]
+            "temperature": min(temperature, 1.0),
+            "max_tokens": max_tokens
+        }
+        headers = {"x-api-key": api_key or "", "anthropic-version": self.API_VERSION}
+        return self.resolve_url(model.endpoint), headers, body
+
+    def parse_response(self, data):
+        return "".join(block["text"] for block in data["content"] if block.get("type") == "text")
+
+    def parse_usage(self, data):
+        usage = data.get("usage") or {}
+        return {"input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0)}
+
+    def parse_stream_event(self, event, data):
+        payload = json.loads(data)
+        if event == "error" or payload.get("type") == "error":
+            raise ProviderError(f"Stream error: {payload.get('error', payload)}")
+        if payload.get("type") == "content_block_delta":
+            return payload["delta"].get("text")
+        return None
+
+
+class GeminiClient(ProviderClient):
+    DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com"
+
+    def build_request(self, model, prompt, api_key, temperature, max_tokens):
+        parts = [{"text": prompt["text"]}]
+        if prompt.get("image"):
+            image = prompt["image"]
+            parts.append({"inline_data": {"mime_type": image["mime_type"], "data": image["base64"]}})
+
+        body = {
+            "system_instruction": {"parts": [{"text": prompt["system"]}]},
+            "contents": [{"role": "user", "parts": parts}],
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens}
+        }
+        headers = {"x-goog-api-key": api_key or ""}
+        return self.resolve_url(model.endpoint) + ":generateContent", headers, body
+
+    def build_stream_request(self, model, prompt, api_key, temperature, max_tokens):
+        url, headers, body = self.build_request(model, prompt, api_key, temperature, max_tokens)
+        url = url[:-len(":generateContent")] + ":streamGenerateContent?alt=sse"
+        return url, headers, body
+
+    def parse_response(self, data):
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+    def parse_usage(self, data):
+        usage = data.get("usageMetadata") or {}
+        return {"input_tokens": usage.get("promptTokenCount", 0),
+                "output_tokens": usage.get("candidatesTokenCount", 0)}
+
+    def parse_stream_event(self, event, data):
+        # Each event is a partial generateContent response
+        payload = json.loads(data)
+        if not payload.get("candidates"):
+            return None
+        return self.parse_response(payload)
+
+
+class HuggingFaceClient(ProviderClient):
+    DEFAULT_BASE_URL = "https://api-inference.huggingface.co"
+
+    def build_request(self, model, prompt, api_key, temperature, max_tokens):
+        # The text-generation API takes a single prompt; images are not supported
+        body = {
+            "inputs": f"{prompt['system']}\n\n{prompt['text']}",
+            "parameters": {
+                # The API rejects a temperature of exactly 0
+                "temperature": max(temperature, 0.01),
+                "max_new_tokens": max_tokens,
+                "return_full_text": False
+            }
+        }
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        return self.resolve_url(model.endpoint), headers, body
+
+    def parse_response(self, data):
+        if isinstance(data, list):
+            data = data[0]
+        return data["generated_text"]
+
+    def parse_stream_event(self, event, data):
+        payload = json.loads(data)
+        if payload.get("error"):
+            raise ProviderError(f"Stream error: {payload['error']}")
+        token = payload.get("token") or {}
+        return None if token.get("special") else token.get("text")
+
+
+def create_provider_clients() -> Dict[str, ProviderClient]:
+    """Clients for each provider type, configured from Config"""
+    huggingface = HuggingFaceClient(Config.HUGGINGFACE_BASE_URL, Config.HUGGINGFACE_API_KEY)
+    return {
+        "openai": OpenAIClient(Config.OPENAI_BASE_URL, Config.OPENAI_API_KEY),
+        "anthropic": AnthropicClient(Config.ANTHROPIC_BASE_URL, Config.ANTHROPIC_API_KEY),
+        "gemini": GeminiClient(Config.GEMINI_BASE_URL, Config.GOOGLE_API_KEY),
+        "huggingface": huggingface,
+        "llama": huggingface,
+    }
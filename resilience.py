@@ -0,0 +1,175 @@
+import time
+import random
+import threading
+from typing import Callable, Dict, Any, Optional, TypeVar
+
+from config import Config
+from providers import ProviderError
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(ProviderError):
+    """Raised without contacting the provider while its circuit is open"""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(
+            f"{provider} is temporarily unavailable after repeated failures; "
+            f"retrying in {retry_in:.0f}s",
+            retry_after=retry_in, retryable=False
+        )
+
+
+class CircuitBreaker:
+    """Fails fast while a provider keeps failing.
+
+    After `failure_threshold` consecutive transient failures the circuit
+    opens and calls are rejected for `reset_timeout` seconds. Then a single
+    trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        # Thread running the half-open trial call, if any
+        self._trial_owner: Optional[int] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_owner = None
+        return self._state
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Whether a call may go through now; in half-open state only one trial call is allowed"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._trial_owner is None:
+                self._trial_owner = threading.get_ident()
+                return True
+            return False
+
+    def release(self):
+        """End this thread's trial call without a verdict, so the next call may try instead"""
+        with self._lock:
+            if self._trial_owner == threading.get_ident():
+                self._trial_owner = None
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._trial_owner = None
+
+
+class ProviderGuard:
+    """Retry with jittered exponential backoff behind a circuit breaker, for one provider.
+
+    Only retryable ProviderErrors (rate limits, 5xx, network errors) are
+    retried or count against the breaker; a provider's Retry-After is
+    honoured as the minimum wait.
+    """
+
+    def __init__(self, provider: str, max_attempts: int = None, base_delay: float = None,
+                 max_delay: float = None, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.max_attempts = max_attempts or Config.RETRY_MAX_ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else Config.RETRY_BASE_DELAY
+        self.max_delay = max_delay if max_delay is not None else Config.RETRY_MAX_DELAY
+        self.breaker = breaker or CircuitBreaker(Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_TIMEOUT)
+
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "successes": 0, "failures": 0, "retries": 0, "rejected": 0}
+        self.in_flight = 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def available(self) -> bool:
+        """False while the circuit is open and calls would be rejected"""
+        return self.breaker.state != CircuitBreaker.OPEN
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Delay before retry number `attempt` ("full jitter"), never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """Run `fn`, retrying transient ProviderErrors; raises CircuitOpenError while the circuit is open"""
+        self._count("calls")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self._call(fn)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _call(self, fn: Callable[[], T]) -> T:
+        attempt = 1
+        while True:
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(self.provider, self.breaker.retry_in())
+            try:
+                result = fn()
+            except ProviderError as e:
+                if not e.retryable:
+                    # The provider answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = self.backoff(attempt, e.retry_after)
+                giving_up = attempt >= self.max_attempts or delay > self.max_delay
+                if giving_up or self.breaker.state == CircuitBreaker.OPEN:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                attempt += 1
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                self._count("successes")
+                return result
+            finally:
+                # Any other exception is not the provider's verdict; free the trial it may hold
+                self.breaker.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["in_flight"] = self.in_flight
+        stats["state"] = self.breaker.state
+        return stats
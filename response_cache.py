@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from datetime import datetime
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """Two-tier cache for model responses.
+
+    An in-memory LRU tier sits in front of an optional on-disk tier whose
+    entries expire after `ttl_seconds`; the disk tier evicts the oldest
+    files once it grows beyond `max_disk_bytes`. Only deterministic
+    requests (temperature 0) are cached.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None,
+                 ttl_seconds: float = 86400, max_disk_bytes: int = 100 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(
+                entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")
+            )
+
+    # Bump when file processing changes what models are shown for the same upload
+    ATTACHMENT_VERSION = 1
+
+    @classmethod
+    def attachment_hash(cls, attachment: Dict[str, Any]) -> str:
+        """Hash of a processed attachment: its content plus what processing derived from it.
+
+        The same upload processed differently (e.g. a sampled rather than a
+        full spreadsheet profile) gives a different prompt, so a different key.
+        """
+        derived = {k: v for k, v in attachment.items() if k not in ("filename", "content", "base64")}
+        key_data = [cls.ATTACHMENT_VERSION, derived if attachment.get("sha256") else attachment]
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def make_key(self, model_name: str, output_mode: str, temperature: float, max_tokens: int,
+                 input_data: Dict[str, Any]) -> str:
+        """Build a cache key from the model, settings, normalised text and attachment hashes"""
+        text = " ".join(input_data.get("text", "").split())
+        attachments = {
+            name: self.attachment_hash(input_data[name])
+            for name in ("image", "file_content") if input_data.get(name)
+        }
+        key_data = [model_name, output_mode, temperature, max_tokens, text, attachments]
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def is_cacheable(self, temperature: float) -> bool:
+        """Sampling with temperature above 0 is not repeatable, so such requests bypass the cache"""
+        if temperature > 0:
+            with self._lock:
+                self.bypassed += 1
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._fresh(self._memory[key])
+
+        response = self._disk_get(key)
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._memory_put(key, response)
+        return self._fresh(response)
+
+    def put(self, key: str, response: Dict[str, Any]):
+        response = {k: v for k, v in response.items() if k not in ("stream", "job", "response_id")}
+        with self._lock:
+            self._memory_put(key, response)
+        self._disk_put(key, response)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes
+            }
+
+    def _fresh(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        # Each answer needs its own response_id for feedback tracking, and
+        # history records when it was given rather than when it was first generated
+        response = dict(response)
+        response["response_id"] = str(uuid.uuid4())
+        response["timestamp"] = datetime.now().isoformat()
+        response["cached"] = True
+        return response
+
+    def _memory_put(self, key: str, response: Dict[str, Any]):
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                self._disk_remove(path)
+                return None
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key: str, response: Dict[str, Any]):
+        if not self.disk_dir:
+            return
+        try:
+            self._disk_write(key, response)
+        except OSError as e:
+            # A full or read-only cache directory must not fail the request
+            logger.warning("Could not write response cache entry %s: %s", key, e)
+
+    def _disk_write(self, key: str, response: Dict[str, Any]):
+        path = self._disk_path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(response, f)
+            size = os.path.getsize(tmp)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        with self._lock:
+            self._disk_bytes += size - old_size
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _disk_remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """Drop expired entries, then the oldest ones until the tier fits its budget"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        now = time.time()
+        for entry in entries:
+            if self._disk_bytes <= self.max_disk_bytes and now - entry.stat().st_mtime <= self.ttl_seconds:
+                break
+            self._disk_remove(entry.path)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Process-wide response cache configured from Config"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=Config.RESPONSE_CACHE_SIZE,
+                    disk_dir=Config.RESPONSE_CACHE_DIR,
+                    ttl_seconds=Config.RESPONSE_CACHE_TTL,
+                    max_disk_bytes=Config.RESPONSE_CACHE_MAX_BYTES
+                )
+    return _cache
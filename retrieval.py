@@ -0,0 +1,189 @@
+import re
+import math
+import threading
+from collections import Counter, OrderedDict
+from typing import BinaryIO, Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from extraction import TextExtractor
+
+_TOKEN = re.compile(r"\w+")
+_WORD = re.compile(r"\S+")
+# Preferred places to end a chunk, best first
+_BOUNDARIES = ("\n\n", "\n", ". ", " ")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_text(pieces: Iterable[str], chunk_chars: int = None, overlap: int = None) -> Iterator[str]:
+    """Regroup streamed text into chunks of about `chunk_chars` characters.
+
+    Chunks end on a paragraph, line, sentence or word boundary where one
+    falls in their second half, and each repeats the last `overlap`
+    characters of the one before so text cut at a boundary stays findable.
+    """
+    chunk_chars = chunk_chars or Config.RETRIEVAL_CHUNK_CHARS
+    overlap = Config.RETRIEVAL_CHUNK_OVERLAP if overlap is None else overlap
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_chars:
+            cut = chunk_chars
+            for boundary in _BOUNDARIES:
+                position = buffer.rfind(boundary, chunk_chars // 2, chunk_chars)
+                if position != -1:
+                    cut = position + len(boundary)
+                    break
+            yield buffer[:cut]
+            buffer = buffer[max(cut - overlap, 1):]
+    if buffer.strip():
+        yield buffer
+
+
+class BM25Index:
+    """Okapi BM25 over a list of text chunks.
+
+    Each term's postings store the chunk ids and the term's precomputed
+    BM25 weight in each chunk, so scoring a query is a vectorised
+    gather-and-add per query term.
+    """
+
+    def __init__(self, chunks: List[str], k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        count = len(chunks)
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = np.zeros(count, dtype=np.float32)
+        for i, chunk in enumerate(chunks):
+            term_counts = Counter(tokenize(chunk))
+            lengths[i] = sum(term_counts.values())
+            for term, tf in term_counts.items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(i)
+                tfs.append(tf)
+
+        average_length = float(lengths.mean()) if count and lengths.any() else 1.0
+        length_norm = k1 * (1 - b + b * lengths / average_length)
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, (ids, tfs) in postings.items():
+            ids = np.asarray(ids, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            weights = idf * tfs * (k1 + 1) / (tfs + length_norm[ids])
+            self._postings[term] = (ids, weights.astype(np.float32))
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """The `k` best-scoring chunks as (chunk id, score), best first; chunks sharing no term are left out"""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term in self._postings:
+                ids, weights = self._postings[term]
+                scores[ids] += weights
+
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[scores[top] > 0]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class DocumentIndex:
+    """A document's chunks and BM25 index, plus the details extracted with them"""
+
+    def __init__(self, chunks: List[str], info: Dict[str, Any]):
+        self.bm25 = BM25Index(chunks)
+        self.info = info
+
+    @property
+    def chunks(self) -> List[str]:
+        return self.bm25.chunks
+
+    def relevant_chunks(self, question: str, k: int = None) -> List[Tuple[int, str]]:
+        """Up to `k` chunks for a question as (chunk id, text), in document order.
+
+        Falls back to the start of the document when nothing matches.
+        """
+        k = k or Config.RETRIEVAL_TOP_K
+        ids = [i for i, _ in self.bm25.search(question, k)] or list(range(min(k, len(self.chunks))))
+        return [(i, self.chunks[i]) for i in sorted(ids)]
+
+
+def index_document(file: BinaryIO, extension: str) -> DocumentIndex:
+    """Extract, count and chunk a document in one streaming pass, then index the chunks"""
+    extractor = TextExtractor()
+    preview = ""
+    chars = newlines = words = 0
+    in_word = False
+
+    def counted(pieces: Iterator[str]) -> Iterator[str]:
+        nonlocal preview, chars, newlines, words, in_word
+        for piece in pieces:
+            if not piece:
+                continue
+            chars += len(piece)
+            newlines += piece.count("\n")
+            words += sum(1 for _ in _WORD.finditer(piece))
+            if in_word and not piece[0].isspace():
+                words -= 1  # a word split across two pieces
+            in_word = not piece[-1].isspace()
+            if len(preview) <= 1000:
+                preview += piece[:1001 - len(preview)]
+            yield piece
+
+    chunks = list(chunk_text(counted(extractor.iter_text(file, extension))))
+    info = {
+        "lines": newlines + 1,
+        "words": words,
+        "truncated": extractor.truncated,
+        "content": preview[:1000] + "..." if chars > 1000 else preview
+    }
+    if extension in (".pdf", ".docx"):
+        info["pages"] = extractor.pages
+    return DocumentIndex(chunks, info)
+
+
+class DocumentIndexCache:
+    """LRU of DocumentIndexes keyed by the uploaded file's content hash"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._indexes: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_hash: Optional[str]) -> Optional[DocumentIndex]:
+        with self._lock:
+            index = self._indexes.get(file_hash)
+            if index is not None:
+                self._indexes.move_to_end(file_hash)
+            return index
+
+    def put(self, file_hash: str, index: DocumentIndex):
+        with self._lock:
+            self._indexes[file_hash] = index
+            self._indexes.move_to_end(file_hash)
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+
+
+_index_cache = None
+_index_cache_lock = threading.Lock()
+
+
+def get_index_cache() -> DocumentIndexCache:
+    """Process-wide document index cache configured from Config"""
+    global _index_cache
+    if _index_cache is None:
+        with _index_cache_lock:
+            if _index_cache is None:
+                _index_cache = DocumentIndexCache(Config.RETRIEVAL_CACHE_SIZE)
+    return _index_cache
@@ -0,0 +1,647 @@
+import os
+import json
+import uuid
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+
+class StorageError(Exception):
+    """Raised when a data file exists but cannot be parsed"""
+
+
+def _read_json(file_path: str) -> Dict[str, Any]:
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        # Never treat a corrupt file as empty: the next save would wipe it
+        raise StorageError(f"Corrupt data file {file_path}: {e}") from e
+
+
+def _atomic_write_json(file_path: str, data: Dict[str, Any]):
+    """Write JSON to a temp file in the same directory, then rename it over the target"""
+    tmp = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, file_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+@contextmanager
+def file_lock(file_path: str, shared: bool = False):
+    """Hold an advisory lock on <file_path>.lock across processes"""
+    with open(file_path + ".lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class StorageBackend:
+    """Interface for persisting users, chat history and feedback"""
+
+    def load_users(self) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def get_user(self, email: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save_user(self, email: str, user_data: Dict[str, Any]):
+        raise NotImplementedError
+
+    def delete_user(self, email: str):
+        """Remove a user together with their history and feedback"""
+        raise NotImplementedError
+
+    def append_history(self, email: str, history_entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def get_history(self, email: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_history_page(self, email: str, limit: int,
+                         before_cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Get up to `limit` entries older than `before_cursor`, oldest first.
+
+        Cursors are opaque to callers. Returns the entries plus the cursor
+        for the next (older) page, or None when there is nothing older.
+        By default the cursor is the entry's position in the user's history.
+        A non-positive limit gives an empty page.
+        """
+        if limit <= 0:
+            return [], None
+        history = self.get_history(email)
+        end = len(history) if before_cursor is None else min(before_cursor, len(history))
+        start = max(0, end - limit)
+        return history[start:end], (start if start > 0 else None)
+
+    def count_history(self, email: str) -> int:
+        return len(self.get_history(email))
+
+    def upsert_feedback(self, email: str, feedback_entry: Dict[str, Any]):
+        """Store feedback, replacing any earlier feedback for the same response_id"""
+        raise NotImplementedError
+
+    def get_feedback(self, email: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_feedback_for(self, email: str, response_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get a user's feedback for the given responses as a response_id -> feedback mapping.
+
+        Responses without feedback are left out.
+        """
+        feedback = {f.get("response_id"): f for f in self.get_feedback(email)}
+        return {rid: feedback[rid] for rid in response_ids if rid in feedback}
+
+
+def _file_stamp(file_path: str) -> Optional[Tuple[int, int, int]]:
+    """Changes whenever the file is rewritten or replaced"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class JSONStorage(StorageBackend):
+    """Original storage layout: one JSON document per data type in data_dir.
+
+    Every read-modify-write cycle holds an exclusive lock on the file and
+    replaces it atomically, so concurrent workers sharing data_dir cannot
+    interleave writes or leave a truncated file behind.
+    """
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.users_file = os.path.join(data_dir, "users.json")
+        self.history_file = os.path.join(data_dir, "history.json")
+        self.feedback_file = os.path.join(data_dir, "feedback.json")
+
+        # email -> response_id -> feedback, rebuilt when feedback.json changes
+        self._feedback_index: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._feedback_stamp = None
+        self._feedback_lock = threading.Lock()
+
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._init_data_files()
+
+    def _init_data_files(self):
+        """Initialize data files if they don't exist"""
+        for file_path in (self.users_file, self.history_file, self.feedback_file):
+            with file_lock(file_path):
+                if not os.path.exists(file_path):
+                    self._write(file_path, {})
+
+    def _read(self, file_path: str) -> Dict[str, Any]:
+        return _read_json(file_path)
+
+    def _write(self, file_path: str, data: Dict[str, Any]):
+        _atomic_write_json(file_path, data)
+
+    @contextmanager
+    def _update(self, file_path: str):
+        """Read-modify-write a data file under an exclusive lock"""
+        with file_lock(file_path):
+            data = self._read(file_path)
+            yield data
+            self._write(file_path, data)
+
+    def load_users(self) -> Dict[str, Dict]:
+        return self._read(self.users_file)
+
+    def get_user(self, email: str) -> Optional[Dict[str, Any]]:
+        return self._read(self.users_file).get(email)
+
+    def save_user(self, email: str, user_data: Dict[str, Any]):
+        with self._update(self.users_file) as users:
+            users[email] = user_data
+
+    def _delete_from(self, file_path: str, email: str):
+        with file_lock(file_path):
+            data = self._read(file_path)
+            if email in data:
+                del data[email]
+                self._write(file_path, data)
+
+    def delete_user(self, email: str):
+        for file_path in (self.users_file, self.history_file, self.feedback_file):
+            self._delete_from(file_path, email)
+
+    def append_history(self, email: str, history_entry: Dict[str, Any]):
+        with self._update(self.history_file) as history_data:
+            history_data.setdefault(email, []).append(history_entry)
+
+    def get_history(self, email: str) -> List[Dict[str, Any]]:
+        return self._read(self.history_file).get(email, [])
+
+    def upsert_feedback(self, email: str, feedback_entry: Dict[str, Any]):
+        response_id = feedback_entry.get("response_id")
+
+        with self._update(self.feedback_file) as feedback_data:
+            # Remove existing feedback for this response if it exists
+            existing_feedback = [f for f in feedback_data.get(email, []) if f.get("response_id") != response_id]
+            existing_feedback.append(feedback_entry)
+            feedback_data[email] = existing_feedback
+
+    def get_feedback(self, email: str) -> List[Dict[str, Any]]:
+        return self._read(self.feedback_file).get(email, [])
+
+    def get_feedback_for(self, email: str, response_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        with self._feedback_lock:
+            # Stat before reading, so a write racing the read only causes another rebuild
+            stamp = _file_stamp(self.feedback_file)
+            if stamp != self._feedback_stamp:
+                self._feedback_index = {
+                    user: {f.get("response_id"): f for f in entries}
+                    for user, entries in self._read(self.feedback_file).items()
+                }
+                self._feedback_stamp = stamp
+            feedback = self._feedback_index.get(email, {})
+        return {rid: feedback[rid] for rid in response_ids if rid in feedback}
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite storage with indexed per-user rows, running in WAL mode.
+
+    On first use the legacy JSON files in data_dir are imported once; the
+    JSON files themselves are left untouched.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_history_email ON history (email, id);
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL,
+            response_id TEXT,
+            data TEXT NOT NULL,
+            UNIQUE (email, response_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_feedback_email ON feedback (email, id);
+        CREATE TABLE IF NOT EXISTS migrations (
+            name TEXT PRIMARY KEY,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+
+    def __init__(self, data_dir: str, db_name: str = "user_data.db"):
+        self.data_dir = data_dir
+        self.db_path = os.path.join(data_dir, db_name)
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        # One connection per thread; Streamlit serves sessions from a thread pool
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+        self.migrate_from_json()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def migrate_from_json(self):
+        """Import users.json, history.json and feedback.json once"""
+        conn = self._connect()
+
+        # Take the write lock before checking so concurrent workers import only once
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM migrations WHERE name = 'json_import'").fetchone():
+                conn.rollback()
+                return
+
+            users = _read_json(os.path.join(self.data_dir, "users.json"))
+            history = _read_json(os.path.join(self.data_dir, "history.json"))
+            feedback = _read_json(os.path.join(self.data_dir, "feedback.json"))
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO users (email, data) VALUES (?, ?)",
+                [(email, json.dumps(user)) for email, user in users.items()]
+            )
+            conn.executemany(
+                "INSERT INTO history (email, data) VALUES (?, ?)",
+                [(email, json.dumps(entry)) for email, entries in history.items() for entry in entries]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO feedback (email, response_id, data) VALUES (?, ?, ?)",
+                [(email, entry.get("response_id"), json.dumps(entry))
+                 for email, entries in feedback.items() for entry in entries]
+            )
+            conn.execute("INSERT INTO migrations (name) VALUES ('json_import')")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def load_users(self) -> Dict[str, Dict]:
+        rows = self._connect().execute("SELECT email, data FROM users")
+        return {email: json.loads(data) for email, data in rows}
+
+    def get_user(self, email: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_user(self, email: str, user_data: Dict[str, Any]):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO users (email, data) VALUES (?, ?)",
+                (email, json.dumps(user_data))
+            )
+
+    def delete_user(self, email: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM users WHERE email = ?", (email,))
+            conn.execute("DELETE FROM history WHERE email = ?", (email,))
+            conn.execute("DELETE FROM feedback WHERE email = ?", (email,))
+
+    def append_history(self, email: str, history_entry: Dict[str, Any]):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO history (email, data) VALUES (?, ?)",
+                (email, json.dumps(history_entry))
+            )
+
+    def get_history(self, email: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT data FROM history WHERE email = ? ORDER BY id", (email,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_history_page(self, email: str, limit: int,
+                         before_cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        if limit <= 0:
+            return [], None
+        # The cursor is the row id of the oldest entry already returned;
+        # fetch one extra row to learn whether an older page exists
+        rows = self._connect().execute(
+            "SELECT id, data FROM history WHERE email = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (email, before_cursor if before_cursor is not None else 2 ** 63 - 1, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if has_more else None
+        return [json.loads(data) for _, data in reversed(rows)], next_cursor
+
+    def count_history(self, email: str) -> int:
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM history WHERE email = ?", (email,)
+        ).fetchone()[0]
+
+    def upsert_feedback(self, email: str, feedback_entry: Dict[str, Any]):
+        # REPLACE deletes the old row and inserts a new one, so the newest
+        # feedback still sorts last like in the JSON layout
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO feedback (email, response_id, data) VALUES (?, ?, ?)",
+                (email, feedback_entry.get("response_id"), json.dumps(feedback_entry))
+            )
+
+    def get_feedback(self, email: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT data FROM feedback WHERE email = ? ORDER BY id", (email,)
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def get_feedback_for(self, email: str, response_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ids = list(dict.fromkeys(response_ids))
+        feedback = {}
+        conn = self._connect()
+        # Batched to stay under SQLite's limit on bound parameters
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT response_id, data FROM feedback WHERE email = ? "
+                f"AND response_id IN ({', '.join('?' * len(batch))})",
+                (email, *batch)
+            )
+            feedback.update((rid, json.loads(data)) for rid, data in rows)
+        return feedback
+
+
+def _index_line(email: str, offset: int, length: int) -> str:
+    # The email is JSON-encoded so tabs or newlines in it cannot break the line
+    return f"{json.dumps(email)}\t{offset}\t{length}\n"
+
+
+def _parse_index_line(line: str) -> Tuple[str, int, int]:
+    email, offset, length = line.rstrip("\n").rsplit("\t", 2)
+    if email.startswith('"'):
+        email = json.loads(email)
+    # Lines written before emails were encoded hold the raw email
+    return email, int(offset), int(length)
+
+
+class JSONLStorage(JSONStorage):
+    """JSON storage with chat history kept in an append-only JSONL log.
+
+    Every history entry is one line in history.jsonl. The sidecar
+    history.idx is append-only too and holds one ``"email"<TAB>offset<TAB>length``
+    line per entry (the email JSON-encoded), so appends are O(1) and a user's history is read by
+    seeking straight to their records. Deleting a user writes a tombstone
+    (offset -1) to the index; once enough of the log is dead a background
+    thread compacts it.
+    """
+
+    COMPACT_MIN_DEAD_BYTES = 1024 * 1024
+
+    def __init__(self, data_dir: str):
+        super().__init__(data_dir)
+        self.log_file = os.path.join(data_dir, "history.jsonl")
+        self.index_file = os.path.join(data_dir, "history.idx")
+
+        self._lock = threading.RLock()
+        self._index: Dict[str, List[Tuple[int, int]]] = {}
+        self._index_inode = None
+        self._index_pos = 0
+        self._dead_bytes = 0
+        self._compacting = False
+
+        with self._locked():
+            if not os.path.exists(self.log_file):
+                self._import_json_history()
+            self._refresh_index()
+
+    @contextmanager
+    def _locked(self, shared: bool = False):
+        """Serialise log access across threads and, via file_lock, across processes"""
+        with self._lock, file_lock(self.log_file, shared=shared):
+            yield
+
+    def _import_json_history(self):
+        """Convert the legacy history.json into the log format once"""
+        history = self._read(self.history_file)
+        tmp_log, tmp_index = self.log_file + ".tmp", self.index_file + ".tmp"
+        with open(tmp_log, 'wb') as log, open(tmp_index, 'w') as index:
+            for email, entries in history.items():
+                for entry in entries:
+                    line = (json.dumps(entry) + "\n").encode()
+                    index.write(_index_line(email, log.tell(), len(line)))
+                    log.write(line)
+        os.replace(tmp_index, self.index_file)
+        os.replace(tmp_log, self.log_file)
+
+    def _refresh_index(self):
+        """Pick up index lines written since the last call (possibly by other processes)"""
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            open(self.index_file, 'a').close()
+            stat = os.stat(self.index_file)
+
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_pos:
+            # The index was replaced by a compaction; start over
+            self._index, self._index_pos, self._dead_bytes = {}, 0, 0
+            self._index_inode = stat.st_ino
+
+        if stat.st_size == self._index_pos:
+            return
+
+        with open(self.index_file, 'rb') as f:
+            f.seek(self._index_pos)
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break  # partially written line; read it next time
+                self._index_pos += len(raw)
+                try:
+                    email, offset, length = _parse_index_line(raw.decode())
+                except ValueError:
+                    continue  # skip a malformed line rather than lose every user's history
+                if offset < 0:
+                    self._dead_bytes += sum(l for _, l in self._index.pop(email, []))
+                else:
+                    self._index.setdefault(email, []).append((offset, length))
+
+    def append_history(self, email: str, history_entry: Dict[str, Any]):
+        line = (json.dumps(history_entry) + "\n").encode()
+        with self._locked():
+            with open(self.log_file, 'ab') as log:
+                offset = log.seek(0, os.SEEK_END)
+                log.write(line)
+            with open(self.index_file, 'a') as index:
+                index.write(_index_line(email, offset, len(line)))
+            self._refresh_index()
+
+    def get_history(self, email: str) -> List[Dict[str, Any]]:
+        with self._locked(shared=True):
+            self._refresh_index()
+            offsets = list(self._index.get(email, []))
+            # Open under the lock so a concurrent compaction can't swap the file
+            # between reading the offsets and opening the log
+            log = open(self.log_file, 'rb')
+
+        return self._read_entries(log, offsets)
+
+    def _read_entries(self, log, offsets: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+        entries = []
+        with log:
+            for offset, length in offsets:
+                log.seek(offset)
+                entries.append(json.loads(log.read(length)))
+        return entries
+
+    def get_history_page(self, email: str, limit: int,
+                         before_cursor: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        if limit <= 0:
+            return [], None
+        # Only the requested slice of the user's offsets is read from the log
+        with self._locked(shared=True):
+            self._refresh_index()
+            offsets = self._index.get(email, [])
+            end = len(offsets) if before_cursor is None else min(before_cursor, len(offsets))
+            start = max(0, end - limit)
+            page_offsets = offsets[start:end]
+            log = open(self.log_file, 'rb')
+
+        return self._read_entries(log, page_offsets), (start if start > 0 else None)
+
+    def count_history(self, email: str) -> int:
+        with self._locked(shared=True):
+            self._refresh_index()
+            return len(self._index.get(email, []))
+
+    def delete_user(self, email: str):
+        for file_path in (self.users_file, self.feedback_file):
+            self._delete_from(file_path, email)
+
+        with self._locked():
+            self._refresh_index()
+            if email in self._index:
+                with open(self.index_file, 'a') as index:
+                    index.write(_index_line(email, -1, 0))
+                self._refresh_index()
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        live_bytes = sum(l for offsets in self._index.values() for _, l in offsets)
+        if (not self._compacting and self._dead_bytes >= self.COMPACT_MIN_DEAD_BYTES
+                and self._dead_bytes > live_bytes):
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Rewrite the log without dead entries.
+
+        The bulk copy runs without holding the lock; entries appended
+        meanwhile are carried over while swapping the files in. If another
+        process compacted the log in the meantime, this run is abandoned.
+        """
+        suffix = f".{uuid.uuid4().hex}.compact"
+        tmp_log, tmp_index = self.log_file + suffix, self.index_file + suffix
+        try:
+            with self._locked(shared=True):
+                self._refresh_index()
+                snapshot = {email: list(offsets) for email, offsets in self._index.items()}
+                log_stat = os.stat(self.log_file)
+
+            moved: Dict[int, int] = {}
+            with open(self.log_file, 'rb') as src, open(tmp_log, 'wb') as dst:
+                for offsets in snapshot.values():
+                    for offset, length in offsets:
+                        src.seek(offset)
+                        moved[offset] = dst.tell()
+                        dst.write(src.read(length))
+
+            with self._locked():
+                if os.stat(self.log_file).st_ino != log_stat.st_ino:
+                    return
+                self._refresh_index()
+                with open(self.log_file, 'rb') as src, open(tmp_log, 'ab') as dst, \
+                        open(tmp_index, 'w') as index:
+                    for email, offsets in self._index.items():
+                        for offset, length in offsets:
+                            if offset < log_stat.st_size:
+                                new_offset = moved[offset]
+                            else:
+                                src.seek(offset)
+                                new_offset = dst.tell()
+                                dst.write(src.read(length))
+                            index.write(_index_line(email, new_offset, length))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.replace(tmp_log, self.log_file)
+                os.replace(tmp_index, self.index_file)
+                self._refresh_index()
+        finally:
+            self._compacting = False
+            for tmp in (tmp_log, tmp_index):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+
+
+class BlobStore:
+    """Content-addressed file store: each blob lives at <blob_dir>/<sha256>.
+
+    Identical payloads map to the same file, so re-uploads are stored once.
+    """
+
+    def __init__(self, blob_dir: str):
+        self.blob_dir = blob_dir
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def put(self, data: bytes) -> str:
+        """Store data and return its SHA-256 hex digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if not os.path.exists(target):
+            tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, target)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+
+STORAGE_BACKENDS = {
+    "json": JSONStorage,
+    "jsonl": JSONLStorage,
+    "sqlite": SQLiteStorage,
+}
+
+
+def create_storage(backend: str, data_dir: str) -> StorageBackend:
+    """Create a storage backend by name"""
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    return STORAGE_BACKENDS[backend](data_dir)
@@ -0,0 +1,213 @@
+import re
+import json
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from table_store import get_table_store
+
+AGGREGATIONS = ("sum", "mean", "median", "min", "max", "count", "nunique")
+OPERATORS = ("==", "!=", ">", ">=", "<", "<=", "in", "contains")
+
+PLANNER_PROMPT = """You plan queries over a table; a program runs them and another step writes the answer.
+Reply with one JSON object and nothing else, in this form:
+{"filters": [{"column": "region", "op": "==", "value": "North"}],
+ "group_by": ["product"],
+ "aggregations": [{"column": "revenue", "func": "sum"}],
+ "columns": [],
+ "sort": {"column": "sum_revenue", "descending": true},
+ "limit": 10}
+"op" is one of == != > >= < <= in contains ("in" takes a list). "func" is one of sum mean median min max count nunique; use "column": "*" with count to count rows.
+Aggregated columns are named func_column (sum_revenue, count). Without aggregations the query lists the filtered rows, showing "columns" (or the filter and sort columns when empty).
+Use only the column names given. If answering needs no calculation over the rows, reply {"query": null}."""
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+class TableQueryError(ValueError):
+    """Raised when a planned query is malformed, names unknown columns or cannot run on the data"""
+
+
+@dataclass(frozen=True)
+class TableQuery:
+    """A filter, group-by and aggregate query planned by a model, run locally with pandas"""
+
+    # (column, op, value)
+    filters: Tuple[Tuple[str, str, Any], ...]
+    group_by: Tuple[str, ...]
+    # (column, func); column "*" counts rows
+    aggregations: Tuple[Tuple[str, str], ...]
+    columns: Tuple[str, ...]
+    sort: Optional[Tuple[str, bool]]
+    limit: int
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], table_columns: List[str]) -> "TableQuery":
+        try:
+            query = cls(
+                filters=tuple((_name(f["column"]), f["op"], f.get("value")) for f in data.get("filters") or ()),
+                group_by=tuple(_name(c) for c in data.get("group_by") or ()),
+                aggregations=tuple((_name(a.get("column", "*")), a["func"]) for a in data.get("aggregations") or ()),
+                columns=tuple(_name(c) for c in data.get("columns") or ()),
+                sort=(_name(data["sort"]["column"]), bool(data["sort"].get("descending", False)))
+                if data.get("sort") else None,
+                limit=max(1, min(int(data.get("limit") or Config.TABLE_QUERY_MAX_ROWS), Config.TABLE_QUERY_MAX_ROWS))
+            )
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise TableQueryError(f"Malformed query plan: {e}")
+
+        unknown = [c for c in query.source_columns() if c not in table_columns]
+        if unknown:
+            raise TableQueryError(f"Unknown columns in query plan: {', '.join(unknown)}")
+        for _, op, _ in query.filters:
+            if op not in OPERATORS:
+                raise TableQueryError(f"Unknown filter operator: {op}")
+        for column, func in query.aggregations:
+            if func not in AGGREGATIONS or (column == "*" and func != "count"):
+                raise TableQueryError(f"Unknown aggregation: {func}({column})")
+        return query
+
+    @classmethod
+    def parse(cls, reply: str, table_columns: List[str]) -> Optional["TableQuery"]:
+        """The query in a model's reply, or None if the model said no query is needed"""
+        match = _JSON_OBJECT.search(reply)
+        if not match:
+            raise TableQueryError("No JSON object in the query plan")
+        try:
+            data = json.loads(match.group())
+        except ValueError as e:
+            raise TableQueryError(f"Query plan is not valid JSON: {e}")
+        if not isinstance(data, dict):
+            raise TableQueryError("Query plan is not a JSON object")
+        if "query" in data and data["query"] is None:
+            return None
+        return cls.from_dict(data.get("query") or data, table_columns)
+
+    def source_columns(self) -> List[str]:
+        """Table columns the query reads, in first-use order"""
+        names = [c for c, _, _ in self.filters] + list(self.group_by)
+        names += [c for c, _ in self.aggregations if c != "*"] + list(self.columns)
+        if self.sort and not self.aggregations:
+            names.append(self.sort[0])
+        return list(dict.fromkeys(names))
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {}
+        if self.filters:
+            data["filters"] = [{"column": c, "op": op, "value": v} for c, op, v in self.filters]
+        if self.group_by:
+            data["group_by"] = list(self.group_by)
+        if self.aggregations:
+            data["aggregations"] = [{"column": c, "func": f} for c, f in self.aggregations]
+        if self.columns:
+            data["columns"] = list(self.columns)
+        if self.sort:
+            data["sort"] = {"column": self.sort[0], "descending": self.sort[1]}
+        data["limit"] = self.limit
+        return data
+
+    def run(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """The full (unlimited) result of the query over `frame`"""
+        try:
+            mask = np.ones(len(frame), dtype=bool)
+            for column, op, value in self.filters:
+                mask &= _condition(frame[column], op, value)
+            frame = frame[mask]
+
+            if self.aggregations:
+                named = {_result_name(c, f): (c, f) for c, f in self.aggregations}
+                if self.group_by:
+                    result = frame.groupby(list(self.group_by), dropna=False, sort=False).agg(
+                        **{name: (c if c != "*" else self.group_by[0], "size" if c == "*" else f)
+                           for name, (c, f) in named.items()}
+                    ).reset_index()
+                else:
+                    result = pd.DataFrame([{
+                        name: len(frame) if c == "*" else getattr(frame[c], f)()
+                        for name, (c, f) in named.items()
+                    }])
+            else:
+                result = frame[list(self.columns or self.source_columns())]
+
+            if self.sort:
+                result = result.sort_values(self.sort[0], ascending=not self.sort[1], kind="stable")
+        except (KeyError, TypeError, ValueError) as e:
+            raise TableQueryError(f"Query failed: {e}")
+        return result
+
+
+def _name(column: Any) -> str:
+    if not isinstance(column, str):
+        raise TypeError(f"column names must be strings, got {json.dumps(column, default=str)}")
+    return column
+
+
+def _result_name(column: str, func: str) -> str:
+    return "count" if column == "*" else f"{func}_{column}"
+
+
+def _coerce(series: pd.Series, value: Any) -> Any:
+    """Match a JSON value to the column's type, so "5" compares to numbers and "2024-01-01" to dates"""
+    if isinstance(value, list):
+        return [_coerce(series, v) for v in value]
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.Timestamp(value)
+    if pd.api.types.is_numeric_dtype(series) and isinstance(value, str):
+        return float(value)
+    return value
+
+
+def _condition(series: pd.Series, op: str, value: Any) -> np.ndarray:
+    if op == "contains":
+        return series.astype(str).str.contains(str(value), case=False, regex=False, na=False).to_numpy()
+    value = _coerce(series, value)
+    if op == "in":
+        return series.isin(value if isinstance(value, list) else [value]).to_numpy()
+    compare = {
+        "==": series.__eq__, "!=": series.__ne__, ">": series.__gt__,
+        ">=": series.__ge__, "<": series.__lt__, "<=": series.__le__
+    }[op]
+    return compare(value).fillna(False).to_numpy(dtype=bool)
+
+
+def run_table_query(content_hash: str, query: TableQuery) -> Dict[str, Any]:
+    """Run a query over a stored table, reading only the columns it uses.
+
+    Returns the first `query.limit` result rows as "result", with the
+    result's "result_rows" and the table's "table_rows".
+    """
+    store = get_table_store()
+    if store is None or not store.has(content_hash):
+        raise TableQueryError("The spreadsheet is not in the table cache")
+    names = store.schema(content_hash).names
+    table = store.read(content_hash, query.source_columns() or names[:1])
+    result = query.run(table.to_pandas())
+    return {"result": result.head(query.limit), "result_rows": len(result), "table_rows": table.num_rows}
+
+
+def describe_table(columns: List[Tuple[str, str]], top_values: Dict[str, Dict[str, int]] = None) -> str:
+    """Column names and types for the planner, with frequent values so filters can match them exactly"""
+    lines = []
+    for name, dtype in columns:
+        line = f"- {name} ({dtype})"
+        values = (top_values or {}).get(name)
+        if values:
+            line += ": e.g. " + ", ".join(json.dumps(v) for v in list(values)[:5])
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_result(query: TableQuery, outcome: Dict[str, Any]) -> str:
+    """The query and its result as text for the answering model"""
+    result = outcome["result"]
+    shown = f"all {outcome['result_rows']}" if len(result) == outcome["result_rows"] else \
+        f"the first {len(result)} of {outcome['result_rows']}"
+    return (
+        f"Exact result of a query run over all {outcome['table_rows']:,} rows of the spreadsheet "
+        f"({shown} result rows). Base the answer on it.\n"
+        f"Query: {json.dumps(query.to_dict(), default=str)}\n"
+        f"{result.to_csv(index=False)}"
+    )
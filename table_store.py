@@ -0,0 +1,167 @@
+import os
+import uuid
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # optional: without pyarrow spreadsheets are re-parsed on every miss
+    pa = None
+
+from config import Config
+
+
+def _widen(schema: "pa.Schema", other: "pa.Schema") -> "pa.Schema":
+    """A schema both tables can be cast to: nulls take the other type, mixed numbers become float, anything else text"""
+    fields = []
+    for field in schema:
+        other_type = other.field(field.name).type if field.name in other.names else field.type
+        if field.type == other_type or pa.types.is_null(other_type):
+            fields.append(field)
+        elif pa.types.is_null(field.type):
+            fields.append(field.with_type(other_type))
+        elif pa.types.is_integer(field.type) and pa.types.is_floating(other_type) or \
+                pa.types.is_floating(field.type) and pa.types.is_integer(other_type):
+            fields.append(field.with_type(pa.float64()))
+        else:
+            fields.append(field.with_type(pa.string()))
+    return pa.schema(fields)
+
+
+class _SchemaChanged(Exception):
+    def __init__(self, schema: "pa.Schema"):
+        super().__init__("column types changed between chunks")
+        self.schema = schema
+
+
+def _to_arrow(chunk: pd.DataFrame) -> "pa.Table":
+    chunk.columns = [str(name) for name in chunk.columns]
+    try:
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Excel columns can mix numbers and text; store such columns as text
+        mixed = chunk.select_dtypes(include="object").columns
+        chunk[mixed] = chunk[mixed].apply(lambda column: column.where(column.isna(), column.astype(str)))
+        return pa.Table.from_pandas(chunk, preserve_index=False)
+
+
+class TableStore:
+    """Parsed spreadsheets kept on disk as Arrow IPC files, keyed by upload content hash.
+
+    A sheet is parsed once, chunk by chunk, and written uncompressed so
+    later reads memory-map the file and touch only the columns they use.
+    The oldest tables are dropped once the directory grows beyond
+    `max_bytes`. Writes are atomic, so worker processes can share a store.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.directory, f"{content_hash}.arrow")
+
+    def has(self, content_hash: str) -> bool:
+        return os.path.exists(self._path(content_hash))
+
+    def put(self, content_hash: str, read_chunks: Callable[[], Iterable[pd.DataFrame]]):
+        """Write a table from the DataFrame chunks `read_chunks()` yields.
+
+        If a later chunk's column types do not fit the ones seen so far,
+        the columns are widened and the chunks read again.
+        """
+        path = self._path(content_hash)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        schema = None
+        try:
+            while True:
+                try:
+                    self._write(tmp, read_chunks(), schema)
+                    break
+                except _SchemaChanged as e:
+                    schema = e.schema
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self._evict()
+
+    def _write(self, path: str, chunks: Iterable[pd.DataFrame], schema: Optional["pa.Schema"]):
+        writer = None
+        try:
+            for chunk in chunks:
+                table = _to_arrow(chunk)
+                if schema is None:
+                    schema = table.schema
+                elif table.schema != schema:
+                    try:
+                        table = table.select(schema.names).cast(schema)
+                    except (KeyError, pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                        raise _SchemaChanged(_widen(schema, table.schema))
+                if writer is None:
+                    writer = pa.ipc.new_file(path, schema)
+                writer.write_table(table)
+            if writer is None:
+                writer = pa.ipc.new_file(path, schema or pa.schema([]))
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _open(self, content_hash: str) -> "pa.ipc.RecordBatchFileReader":
+        path = self._path(content_hash)
+        os.utime(path)  # mark as recently used for eviction
+        return pa.ipc.open_file(pa.memory_map(path, "r"))
+
+    def schema(self, content_hash: str) -> "pa.Schema":
+        return self._open(content_hash).schema
+
+    def read(self, content_hash: str, columns: Optional[List[str]] = None) -> "pa.Table":
+        """The whole table, or just `columns`, backed by the memory-mapped file"""
+        table = self._open(content_hash).read_all()
+        return table.select(columns) if columns is not None else table
+
+    def iter_chunks(self, content_hash: str, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """The table as DataFrames, one per stored chunk; an empty table gives one empty frame with its columns"""
+        reader = self._open(content_hash)
+        batches = (pa.Table.from_batches([reader.get_batch(i)]) for i in range(reader.num_record_batches))
+        if not reader.num_record_batches:
+            batches = iter([reader.schema.empty_table()])
+        for batch in batches:
+            yield (batch.select(columns) if columns is not None else batch).to_pandas()
+
+    def _evict(self):
+        """Drop the least recently used tables until the store fits its budget"""
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith(".arrow")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+            except OSError:
+                pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_table_store() -> Optional[TableStore]:
+    """Process-wide table store configured from Config, or None when pyarrow is not installed"""
+    global _store
+    if pa is None or not Config.TABLE_CACHE_DIR:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TableStore(Config.TABLE_CACHE_DIR, Config.TABLE_CACHE_MAX_BYTES)
+    return _store
@@ -0,0 +1,121 @@
+import re
+from typing import Dict, Any, Tuple
+
+from model_catalog import ModelSpec
+from providers import ProviderError
+
+# Average characters per token of each provider's tokenizer on English text and code
+CHARS_PER_TOKEN = {
+    "openai": 4.0,
+    "anthropic": 3.5,
+    "gemini": 4.0,
+    "huggingface": 3.2,
+    "llama": 3.2,
+}
+
+# Rough cost of one attached image
+IMAGE_TOKENS = {
+    "openai": 765,
+    "anthropic": 1600,
+    "gemini": 258,
+}
+
+# Leeway for the estimate's error and the chat format's own tokens
+SAFETY_MARGIN = 0.1
+MIN_RESPONSE_TOKENS = 100
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+class ContextOverflowError(ProviderError):
+    """Raised before dispatch when a prompt cannot fit a model's context window"""
+
+    def __init__(self, message: str):
+        super().__init__(message, retryable=False)
+
+
+def estimate_tokens(text: str, provider: str) -> int:
+    """Fast local estimate of the tokens `text` costs with a provider's tokenizer.
+
+    Whichever is larger of the character-based estimate and the number of
+    words and punctuation marks, so symbol-heavy text is not undercounted.
+    """
+    if not text:
+        return 0
+    by_chars = len(text) / CHARS_PER_TOKEN.get(provider, 3.5)
+    return int(max(by_chars, len(_PIECES.findall(text)))) + 1
+
+
+def prompt_tokens(prompt: Dict[str, Any], provider: str) -> int:
+    """Estimated input tokens of a prompt built by AIModelManager._build_prompt"""
+    tokens = estimate_tokens(prompt["system"], provider) + estimate_tokens(prompt["text"], provider)
+    tokens += estimate_tokens(prompt.get("attachment", ""), provider)
+    if prompt.get("image"):
+        tokens += IMAGE_TOKENS.get(provider, 0)
+    return tokens
+
+
+def truncate_to_tokens(text: str, tokens: int, provider: str) -> str:
+    """Shorten `text` to at most `tokens`, keeping its start and end around a marker.
+
+    Returns an empty string if not even the marker fits.
+    """
+    estimate = estimate_tokens(text, provider)
+    keep = len(text)
+    while estimate > tokens:
+        # Shrink by how far over budget the last cut was; the kept slices may
+        # be denser than the text on average, so re-check every cut
+        keep = int(keep * tokens / estimate * 0.95)
+        if keep <= 0:
+            return ""
+        head = keep * 2 // 3
+        tail = keep - head
+        marker = f"\n\n[... {len(text) - keep:,} characters omitted to fit the context window ...]\n\n"
+        truncated = text[:head] + marker + (text[-tail:] if tail else "")
+        estimate = estimate_tokens(truncated, provider)
+        if estimate <= tokens:
+            return truncated
+    return text
+
+
+def fit_prompt(prompt: Dict[str, Any], spec: ModelSpec, max_tokens: int) -> Tuple[Dict[str, Any], int]:
+    """Budget a prompt and response against the model's context window.
+
+    The attachment is dropped or truncated first, then the response budget
+    is reduced. Returns the prompt ready to send, with the attachment
+    merged into its text, and the max_tokens to request. Raises
+    ContextOverflowError if even the bare prompt does not fit.
+    """
+    provider = spec.type
+    window = int(spec.context_window * (1 - SAFETY_MARGIN))
+    max_tokens = min(max_tokens, spec.max_tokens)
+    prompt = dict(prompt)
+    attachment = prompt.pop("attachment", "")
+
+    base = prompt_tokens(prompt, provider)
+    if prompt.get("image") and base + MIN_RESPONSE_TOKENS > window:
+        del prompt["image"]
+        base = prompt_tokens(prompt, provider)
+    if base + MIN_RESPONSE_TOKENS > window:
+        raise ContextOverflowError(
+            f"The message needs about {base:,} tokens, more than {spec.name}'s "
+            f"{spec.context_window:,}-token context window allows"
+        )
+
+    if attachment:
+        # Keep room for the full response when possible, or at least a short one
+        room = window - base - max_tokens
+        if room < estimate_tokens(attachment, provider):
+            room = max(room, (window - base - MIN_RESPONSE_TOKENS) // 2)
+        text = prompt["text"]
+        while True:
+            part = truncate_to_tokens(attachment, room, provider) if room > 0 else ""
+            prompt["text"] = "\n\n".join(s for s in (text, part) if s)
+            # Joining can cost a token or two more than the parts did
+            overflow = prompt_tokens(prompt, provider) + MIN_RESPONSE_TOKENS - window
+            if overflow <= 0 or not part:
+                break
+            room -= overflow
+
+    max_tokens = max(min(max_tokens, window - prompt_tokens(prompt, provider)), MIN_RESPONSE_TOKENS)
+    return prompt, max_tokens